@@ -1,10 +1,20 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
-from pymongo import MongoClient
+from flask import Blueprint, Response, request, jsonify
+from flask_jwt_extended import jwt_required, get_jwt, get_jwt_identity
+from pymongo import MongoClient, IndexModel
+from pymongo.errors import PyMongoError
 from bson import ObjectId
 from datetime import datetime
+from functools import wraps
+import csv
+import io
+import json
 import os
+import threading
+import time
+import zlib
 from dotenv import load_dotenv
+from scripts.mongo_indexes import ensure_indexes, explain_queries, print_report
+from scripts.stock_status import backfill_stock_status, stock_status
 
 load_dotenv()
 
@@ -14,6 +24,71 @@ admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
 client = MongoClient(os.getenv('MONGODB_URI', 'mongodb://localhost:27017/'))
 db = client['sweet_delights_bakery']
 
+# Indexes for the queries the admin routes issue; created idempotently when the
+# blueprint is registered and by `flask admin ensure-indexes`
+INDEXES = {
+    'products': [
+        # Text index backing product search; stems English words so "croissants" finds "Croissant"
+        IndexModel([('name', 'text'), ('description', 'text')], name='products_text',
+                   weights={'name': 10, 'description': 2}, default_language='english'),
+        # Inventory filters query stockStatus; the name suffix serves the default sort
+        IndexModel([('stockStatus', 1), ('category', 1), ('name', 1)], name='products_stock_status'),
+        IndexModel([('category', 1), ('name', 1)], name='products_category_name'),
+        IndexModel([('isActive', 1), ('name', 1)], name='products_active_name'),
+        IndexModel([('isActive', 1), ('stock', 1)], name='products_active_stock')
+    ],
+    'orders': [
+        IndexModel([('createdAt', -1)], name='orders_created'),
+        IndexModel([('status', 1), ('createdAt', -1)], name='orders_status_created'),
+        IndexModel([('status', 1), ('_id', 1)], name='orders_status_id'),
+        IndexModel([('userId', 1), ('createdAt', -1)], name='orders_user_created')
+    ],
+    'users': [
+        IndexModel([('email', 1)], name='users_email'),
+        IndexModel([('isActive', 1)], name='users_active')
+    ],
+    'admin_users': [IndexModel([('username', 1)], name='admin_users_username')]
+}
+
+QUERY_PROBES = [
+    {'label': 'GET /products?category', 'collection': 'products',
+     'filter': {'category': 'Cakes'}, 'sort': {'name': 1}},
+    {'label': 'GET /products?stockFilter', 'collection': 'products',
+     'filter': {'stockStatus': 'low-stock'}, 'sort': {'name': 1}},
+    {'label': 'GET /inventory, /export/products', 'collection': 'products',
+     'filter': {'isActive': True}, 'sort': {'name': 1}},
+    {'label': 'dashboard out of stock', 'collection': 'products',
+     'filter': {'isActive': True, 'stock': 0}},
+    {'label': 'GET /orders', 'collection': 'orders',
+     'filter': {}, 'sort': {'createdAt': -1}},
+    {'label': 'GET /orders?status', 'collection': 'orders',
+     'filter': {'status': 'processing'}, 'sort': {'createdAt': -1}},
+    {'label': 'GET /export/orders?status', 'collection': 'orders',
+     'filter': {'status': 'processing'}, 'sort': {'_id': 1}},
+    {'label': 'orders by customer', 'collection': 'orders',
+     'filter': {'userId': 'user-id'}, 'sort': {'createdAt': -1}},
+    {'label': 'dashboard customers', 'collection': 'users',
+     'filter': {'isActive': True}},
+    {'label': 'customer by email', 'collection': 'users',
+     'filter': {'email': 'someone@example.com'}},
+    {'label': 'POST /login', 'collection': 'admin_users',
+     'filter': {'username': 'admin'}},
+    {'label': 'GET /analytics/sales', 'collection': 'orders',
+     'filter': {'createdAt': {'$gte': datetime(2024, 1, 1)}}}
+]
+
+@admin_bp.record_once
+def bootstrap_indexes(state):
+    # Best effort: an unreachable MongoDB must not stop the app from registering
+    try:
+        _, errors = ensure_indexes(db, INDEXES)
+        backfill_stock_status(db.products)
+    except PyMongoError as e:
+        state.app.logger.warning('Admin bootstrap skipped, MongoDB unavailable: %s', e)
+        return
+    for collection, message in errors.items():
+        state.app.logger.warning('Indexes on %s not created: %s', collection, message)
+
 # Admin credentials
 ADMIN_CREDENTIALS = {
     'username': '$Uv#ns0',
@@ -29,12 +104,62 @@ def serialize_doc(doc):
 def serialize_docs(docs):
     return [serialize_doc(doc) for doc in docs]
 
+# Admin ids confirmed against admin_users, cached so each admin API call
+# doesn't pay an extra Mongo round trip. admin_login is the only code path that
+# writes admin accounts and it drops the entry; an account deactivated
+# (isActive: false) or deleted directly in Mongo keeps access for at most
+# ADMIN_CACHE_TTL seconds in each worker, so keep the TTL short. Anything that
+# adds admin writes must call invalidate_admin_cache().
+ADMIN_CACHE_TTL = int(os.getenv('ADMIN_CACHE_TTL', 15))
+_admin_cache = {}
+_admin_cache_lock = threading.Lock()
+
+def invalidate_admin_cache(admin_id=None):
+    with _admin_cache_lock:
+        if admin_id is None:
+            _admin_cache.clear()
+        else:
+            _admin_cache.pop(str(admin_id), None)
+
 def is_admin(user_id):
     """Check if user is admin"""
-    # In a real app, you'd check against admin users in database
-    # For now, we'll use a simple check
-    admin_user = db.admin_users.find_one({'_id': ObjectId(user_id)})
-    return admin_user is not None
+    now = time.monotonic()
+    with _admin_cache_lock:
+        expires_at = _admin_cache.get(user_id)
+        if expires_at and expires_at > now:
+            return True
+    if not ObjectId.is_valid(str(user_id)):
+        return False
+    admin_user = db.admin_users.find_one({'_id': ObjectId(user_id), 'isActive': {'$ne': False}}, {'_id': 1})
+    if admin_user is None:
+        return False
+    with _admin_cache_lock:
+        _admin_cache[user_id] = now + ADMIN_CACHE_TTL
+    return True
+
+def admin_required(f):
+    """
+    jwt_required() plus an admin check. Tokens carry a signed role claim;
+    anything other than 'admin' is refused without touching the database,
+    and the admin id itself is confirmed through the is_admin() cache.
+    """
+    @wraps(f)
+    @jwt_required()
+    def decorated_function(*args, **kwargs):
+        role = get_jwt().get('role')
+        if role is not None and role != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        if not is_admin(get_jwt_identity()):
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+@admin_bp.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Create the declared indexes, backfill stockStatus and flag admin queries that still COLLSCAN."""
+    created, errors = ensure_indexes(db, INDEXES)
+    print(f'stockStatus set on {backfill_stock_status(db.products)} product(s)')
+    print_report(created, errors, explain_queries(db, QUERY_PROBES))
 
 # Admin Authentication
 @admin_bp.route('/login', methods=['POST'])
@@ -68,9 +193,10 @@ def admin_login():
                     {'_id': ObjectId(admin_id)},
                     {'$set': {'lastLogin': datetime.utcnow()}}
                 )
+            invalidate_admin_cache(admin_id)
             
             from flask_jwt_extended import create_access_token
-            access_token = create_access_token(identity=admin_id)
+            access_token = create_access_token(identity=admin_id, additional_claims={'role': 'admin'})
             
             return jsonify({
                 'message': 'Admin login successful',
@@ -89,13 +215,9 @@ def admin_login():
 
 # Dashboard Stats
 @admin_bp.route('/dashboard/stats', methods=['GET'])
-@jwt_required()
+@admin_required
 def get_dashboard_stats():
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         # Get product stats
         total_products = db.products.count_documents({'isActive': True})
         out_of_stock = db.products.count_documents({'isActive': True, 'stock': 0})
@@ -154,52 +276,58 @@ def get_dashboard_stats():
 
 # Product Management
 @admin_bp.route('/products', methods=['GET'])
-@jwt_required()
+@admin_required
 def get_admin_products():
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         category = request.args.get('category')
         stock_filter = request.args.get('stockFilter')
         search = request.args.get('search', '')
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', 50)), 1), 200)
         
         # Build query
         query = {}
         if category and category != 'all':
             query['category'] = category
         
+        if stock_filter and stock_filter != 'all':
+            if stock_filter not in ('out-of-stock', 'low-stock', 'in-stock'):
+                return jsonify({'error': 'stockFilter must be one of: all, out-of-stock, low-stock, in-stock'}), 400
+            query['stockStatus'] = stock_filter
+        
         if search:
-            query['$or'] = [
-                {'name': {'$regex': search, '$options': 'i'}},
-                {'description': {'$regex': search, '$options': 'i'}}
-            ]
+            query['$text'] = {'$search': search}
         
-        products = list(db.products.find(query).sort('name', 1))
+        skip = (page - 1) * limit
+        if search and request.args.get('sort') == 'relevance':
+            products = list(db.products.find(query, {'score': {'$meta': 'textScore'}})
+                            .sort([('score', {'$meta': 'textScore'})])
+                            .skip(skip)
+                            .limit(limit))
+            for product in products:
+                product.pop('score', None)
+        else:
+            products = list(db.products.find(query).sort('name', 1).skip(skip).limit(limit))
         
-        # Apply stock filter
-        if stock_filter and stock_filter != 'all':
-            if stock_filter == 'out-of-stock':
-                products = [p for p in products if p['stock'] == 0]
-            elif stock_filter == 'low-stock':
-                products = [p for p in products if 0 < p['stock'] <= p.get('lowStockThreshold', 10)]
-            elif stock_filter == 'in-stock':
-                products = [p for p in products if p['stock'] > p.get('lowStockThreshold', 10)]
+        total = db.products.count_documents(query)
         
-        return jsonify({'products': serialize_docs(products)}), 200
+        return jsonify({
+            'products': serialize_docs(products),
+            'pagination': {
+                'page': page,
+                'limit': limit,
+                'total': total,
+                'pages': (total + limit - 1) // limit
+            }
+        }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/products', methods=['POST'])
-@jwt_required()
+@admin_required
 def create_product():
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         data = request.get_json()
         
         # Validate required fields
@@ -225,6 +353,7 @@ def create_product():
             'updatedAt': datetime.utcnow()
         }
         
+        product_data['stockStatus'] = stock_status(product_data['stock'], product_data['lowStockThreshold'])
         result = db.products.insert_one(product_data)
         
         return jsonify({
@@ -236,13 +365,9 @@ def create_product():
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/products/<product_id>', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_product(product_id):
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         data = request.get_json()
         
         # Check if product exists
@@ -269,6 +394,11 @@ def update_product(product_id):
             update_data['stock'] = int(data['stock'])
         if 'lowStockThreshold' in data:
             update_data['lowStockThreshold'] = int(data['lowStockThreshold'])
+        if 'stock' in data or 'lowStockThreshold' in data:
+            update_data['stockStatus'] = stock_status(
+                update_data.get('stock', product.get('stock', 0)),
+                update_data.get('lowStockThreshold', product.get('lowStockThreshold', 10))
+            )
         if 'isActive' in data:
             update_data['isActive'] = data['isActive']
         
@@ -283,13 +413,9 @@ def update_product(product_id):
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/products/<product_id>', methods=['DELETE'])
-@jwt_required()
+@admin_required
 def delete_product(product_id):
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         # Check if product exists
         product = db.products.find_one({'_id': ObjectId(product_id)})
         if not product:
@@ -307,13 +433,9 @@ def delete_product(product_id):
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/products/<product_id>/stock', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_product_stock(product_id):
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         data = request.get_json()
         new_stock = data.get('stock')
         
@@ -327,7 +449,11 @@ def update_product_stock(product_id):
         
         db.products.update_one(
             {'_id': ObjectId(product_id)},
-            {'$set': {'stock': int(new_stock), 'updatedAt': datetime.utcnow()}}
+            {'$set': {
+                'stock': int(new_stock),
+                'stockStatus': stock_status(int(new_stock), product.get('lowStockThreshold', 10)),
+                'updatedAt': datetime.utcnow()
+            }}
         )
         
         return jsonify({'message': 'Stock updated successfully'}), 200
@@ -337,13 +463,9 @@ def update_product_stock(product_id):
 
 # Inventory Management
 @admin_bp.route('/inventory', methods=['GET'])
-@jwt_required()
+@admin_required
 def get_inventory():
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         # Get all products with inventory details
         products = list(db.products.find({'isActive': True}).sort('name', 1))
         
@@ -367,13 +489,9 @@ def get_inventory():
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/inventory/<product_id>/restock', methods=['POST'])
-@jwt_required()
+@admin_required
 def restock_item(product_id):
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         # Check if product exists
         product = db.products.find_one({'_id': ObjectId(product_id)})
         if not product:
@@ -386,6 +504,7 @@ def restock_item(product_id):
             {
                 '$set': {
                     'stock': max_capacity,
+                    'stockStatus': stock_status(max_capacity, product.get('lowStockThreshold', 10)),
                     'lastRestocked': datetime.utcnow(),
                     'updatedAt': datetime.utcnow()
                 }
@@ -399,13 +518,9 @@ def restock_item(product_id):
 
 # Order Management
 @admin_bp.route('/orders', methods=['GET'])
-@jwt_required()
+@admin_required
 def get_admin_orders():
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         status = request.args.get('status')
         page = int(request.args.get('page', 1))
         limit = int(request.args.get('limit', 20))
@@ -423,9 +538,17 @@ def get_admin_orders():
         
         total = db.orders.count_documents(query)
         
-        # Populate user details
+        # Populate user details with one batched lookup for the whole page
+        user_ids = {ObjectId(order['userId']) for order in orders if ObjectId.is_valid(str(order.get('userId')))}
+        users = {
+            str(user['_id']): user
+            for user in db.users.find(
+                {'_id': {'$in': list(user_ids)}},
+                {'firstName': 1, 'lastName': 1, 'email': 1}
+            )
+        } if user_ids else {}
         for order in orders:
-            user = db.users.find_one({'_id': ObjectId(order['userId'])})
+            user = users.get(str(order.get('userId')))
             if user:
                 order['customer'] = {
                     'name': f"{user['firstName']} {user['lastName']}",
@@ -446,13 +569,9 @@ def get_admin_orders():
         return jsonify({'error': str(e)}), 500
 
 @admin_bp.route('/orders/<order_id>/status', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_order_status(order_id):
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         data = request.get_json()
         new_status = data.get('status')
         
@@ -479,14 +598,44 @@ def update_order_status(order_id):
         return jsonify({'error': str(e)}), 500
 
 # Analytics
+def sales_summary(start_date):
+    """Sales by day and top products since start_date; the match uses orders_created."""
+    sales_pipeline = [
+        {'$match': {'createdAt': {'$gte': start_date}}},
+        {
+            '$group': {
+                '_id': {
+                    'year': {'$year': '$createdAt'},
+                    'month': {'$month': '$createdAt'},
+                    'day': {'$dayOfMonth': '$createdAt'}
+                },
+                'total': {'$sum': '$total'},
+                'orders': {'$sum': 1}
+            }
+        },
+        {'$sort': {'_id': 1}}
+    ]
+
+    top_products_pipeline = [
+        {'$match': {'createdAt': {'$gte': start_date}}},
+        {'$unwind': '$items'},
+        {
+            '$group': {
+                '_id': {'$toString': '$items.productId'},
+                'name': {'$first': '$items.name'},
+                'quantity': {'$sum': '$items.quantity'},
+                'revenue': {'$sum': '$items.total'}
+            }
+        },
+        {'$sort': {'quantity': -1}},
+        {'$limit': 10}
+    ]
+    return list(db.orders.aggregate(sales_pipeline)), list(db.orders.aggregate(top_products_pipeline))
+
 @admin_bp.route('/analytics/sales', methods=['GET'])
-@jwt_required()
+@admin_required
 def get_sales_analytics():
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
         period = request.args.get('period', 'week')  # week, month, year
         
         # Calculate date range
@@ -498,42 +647,7 @@ def get_sales_analytics():
         else:  # year
             start_date = datetime.utcnow().replace(month=1, day=1, hour=0, minute=0, second=0, microsecond=0)
         
-        # Sales by day
-        sales_pipeline = [
-            {'$match': {'createdAt': {'$gte': start_date}}},
-            {
-                '$group': {
-                    '_id': {
-                        'year': {'$year': '$createdAt'},
-                        'month': {'$month': '$createdAt'},
-                        'day': {'$dayOfMonth': '$createdAt'}
-                    },
-                    'total': {'$sum': '$total'},
-                    'orders': {'$sum': 1}
-                }
-            },
-            {'$sort': {'_id': 1}}
-        ]
-        
-        sales_data = list(db.orders.aggregate(sales_pipeline))
-        
-        # Top products
-        top_products_pipeline = [
-            {'$match': {'createdAt': {'$gte': start_date}}},
-            {'$unwind': '$items'},
-            {
-                '$group': {
-                    '_id': '$items.productId',
-                    'name': {'$first': '$items.name'},
-                    'quantity': {'$sum': '$items.quantity'},
-                    'revenue': {'$sum': '$items.total'}
-                }
-            },
-            {'$sort': {'quantity': -1}},
-            {'$limit': 10}
-        ]
-        
-        top_products = list(db.orders.aggregate(top_products_pipeline))
+        sales_data, top_products = sales_summary(start_date)
         
         return jsonify({
             'salesData': sales_data,
@@ -544,30 +658,153 @@ def get_sales_analytics():
         return jsonify({'error': str(e)}), 500
 
 # Export Data
+# Exports stream from a server-side cursor in fixed-size batches, so memory
+# stays flat regardless of how many rows are exported.
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', 500))
+
+def format_timestamp(value):
+    return value.strftime('%Y-%m-%d %H:%M:%S') if isinstance(value, datetime) else value
+
+def stream_export(cursor, columns, to_row, name, default_format='csv'):
+    """
+    Response streaming cursor rows as CSV, NDJSON or a JSON {"data": [...]}
+    body (?format=csv|ndjson|json), optionally gzip-compressed (?gzip=true).
+    """
+    fmt = request.args.get('format', default_format).lower()
+    if fmt not in ('csv', 'ndjson', 'json'):
+        return jsonify({'error': 'format must be csv, ndjson or json'}), 400
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+
+    def generate():
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+        def flush():
+            data = buf.getvalue().encode('utf-8')
+            buf.seek(0)
+            buf.truncate(0)
+            return compressor.compress(data) if compressor else data
+
+        if fmt == 'csv':
+            writer.writerow(columns)
+        elif fmt == 'json':
+            buf.write('{"data": [')
+        for count, doc in enumerate(cursor.batch_size(EXPORT_BATCH_SIZE), 1):
+            row = to_row(doc)
+            if fmt == 'csv':
+                writer.writerow([row.get(c) for c in columns])
+            elif fmt == 'json':
+                buf.write((', ' if count > 1 else '') + json.dumps(row, default=str))
+            else:
+                buf.write(json.dumps(row, default=str) + '\n')
+            if count % EXPORT_BATCH_SIZE == 0:
+                chunk = flush()
+                if chunk:
+                    yield chunk
+        if fmt == 'json':
+            buf.write(']}')
+        chunk = flush()
+        if compressor:
+            chunk += compressor.flush()
+        if chunk:
+            yield chunk
+
+    if fmt == 'json' and not compress:
+        return Response(generate(), mimetype='application/json')
+
+    filename = f"{name}-{datetime.utcnow().strftime('%Y%m%d%H%M%S')}.{fmt}"
+    mimetype = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson', 'json': 'application/json'}[fmt]
+    if compress:
+        filename += '.gz'
+        mimetype = 'application/gzip'
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename="{filename}"'
+    })
+
 @admin_bp.route('/export/products', methods=['GET'])
-@jwt_required()
+@admin_required
 def export_products():
     try:
-        user_id = get_jwt_identity()
-        if not is_admin(user_id):
-            return jsonify({'error': 'Admin access required'}), 403
-        
-        products = list(db.products.find({'isActive': True}).sort('name', 1))
-        
-        export_data = []
-        for product in products:
-            stock_status = 'Out of Stock' if product.get('stock', 0) == 0 else 'Low Stock' if product.get('stock', 0) <= product.get('lowStockThreshold', 10) else 'In Stock'
-            
-            export_data.append({
+        def to_row(product):
+            stock = product.get('stock', 0)
+            stock_status = 'Out of Stock' if stock == 0 else 'Low Stock' if stock <= product.get('lowStockThreshold', 10) else 'In Stock'
+            return {
                 'name': product['name'],
                 'category': product['category'],
                 'price': product['price'],
-                'stock': product.get('stock', 0),
+                'stock': stock,
                 'status': stock_status,
-                'lastUpdated': product.get('updatedAt', datetime.utcnow()).strftime('%Y-%m-%d %H:%M:%S')
-            })
+                'lastUpdated': format_timestamp(product.get('updatedAt', datetime.utcnow()))
+            }
+        
+        cursor = db.products.find(
+            {'isActive': True},
+            {'name': 1, 'category': 1, 'price': 1, 'stock': 1, 'lowStockThreshold': 1, 'updatedAt': 1}
+        ).sort('name', 1)
+        columns = ['name', 'category', 'price', 'stock', 'status', 'lastUpdated']
+        # JSON stays the default for existing callers; CSV/NDJSON are opt-in
+        return stream_export(cursor, columns, to_row, 'products', default_format='json')
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/export/orders', methods=['GET'])
+@admin_required
+def export_orders():
+    try:
+        query = {}
+        status = request.args.get('status')
+        if status and status != 'all':
+            query['status'] = status
+        
+        def to_row(order):
+            return {
+                'id': str(order['_id']),
+                'orderNumber': order.get('orderNumber'),
+                'userId': order.get('userId'),
+                'status': order.get('status'),
+                'items': len(order.get('items', [])),
+                'subtotal': order.get('subtotal'),
+                'discount': order.get('discount'),
+                'shipping': order.get('shipping'),
+                'tax': order.get('tax'),
+                'total': order.get('total'),
+                'paymentMethod': order.get('paymentMethod'),
+                'createdAt': format_timestamp(order.get('createdAt'))
+            }
+        
+        projection = {f: 1 for f in ['orderNumber', 'userId', 'status', 'subtotal', 'discount',
+                                     'shipping', 'tax', 'total', 'paymentMethod', 'createdAt']}
+        projection['items.productId'] = 1  # enough to count line items
+        cursor = db.orders.find(query, projection).sort('_id', 1)
+        columns = ['id', 'orderNumber', 'userId', 'status', 'items', 'subtotal', 'discount',
+                   'shipping', 'tax', 'total', 'paymentMethod', 'createdAt']
+        return stream_export(cursor, columns, to_row, 'orders')
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/export/customers', methods=['GET'])
+@admin_required
+def export_customers():
+    try:
+        def to_row(user):
+            return {
+                'id': str(user['_id']),
+                'firstName': user.get('firstName'),
+                'lastName': user.get('lastName'),
+                'email': user.get('email'),
+                'isActive': user.get('isActive', True),
+                'createdAt': format_timestamp(user.get('createdAt'))
+            }
         
-        return jsonify({'data': export_data}), 200
+        cursor = db.users.find(
+            {},
+            {'firstName': 1, 'lastName': 1, 'email': 1, 'isActive': 1, 'createdAt': 1}
+        ).sort('_id', 1)
+        columns = ['id', 'firstName', 'lastName', 'email', 'isActive', 'createdAt']
+        return stream_export(cursor, columns, to_row, 'customers')
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'error': str(e)}), 500
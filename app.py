@@ -1,19 +1,93 @@
-from flask import Flask, jsonify, request, session
+from flask import Flask, g, jsonify, request, session
 from flask_cors import CORS
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 import sqlite3
 import hashlib
+import hmac
 import os
+import re
 import json
+import queue
 from functools import wraps
+from werkzeug.security import check_password_hash, generate_password_hash
+from scripts.http_cache import conditional_get
+from scripts.password_pool import HasherBusy, PasswordHasher
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-in-production'
 CORS(app, supports_credentials=True)
 
+DATABASE = os.getenv('BAKERY_DB', 'bakery.db')
+
+# Connection tuning (override via environment)
+SQLITE_CACHE_SIZE_KB = int(os.getenv('SQLITE_CACHE_SIZE_KB', 20000))
+SQLITE_MMAP_SIZE = int(os.getenv('SQLITE_MMAP_SIZE', 256 * 1024 * 1024))
+SQLITE_STATEMENT_CACHE = int(os.getenv('SQLITE_STATEMENT_CACHE', 256))
+SQLITE_BUSY_TIMEOUT = float(os.getenv('SQLITE_BUSY_TIMEOUT', 5))
+
+SQLITE_POOL_SIZE = int(os.getenv('SQLITE_POOL_SIZE', 8))
+
+# The threaded dev server starts a thread per request, so connections are
+# shared through a small pool rather than tied to a thread.
+_db_pool = queue.LifoQueue(maxsize=SQLITE_POOL_SIZE)
+_db_pool_pid = os.getpid()
+
+def _open_db():
+    conn = sqlite3.connect(
+        DATABASE,
+        timeout=SQLITE_BUSY_TIMEOUT,
+        cached_statements=SQLITE_STATEMENT_CACHE,
+        check_same_thread=False
+    )
+    # WAL lets admin reads run while an order is being written
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-{}'.format(SQLITE_CACHE_SIZE_KB))
+    conn.execute('PRAGMA mmap_size={}'.format(SQLITE_MMAP_SIZE))
+    conn.execute('PRAGMA temp_store=MEMORY')
+    return conn
+
+def _checkout_db():
+    global _db_pool, _db_pool_pid
+    # A forked worker must not reuse its parent's connections
+    if _db_pool_pid != os.getpid():
+        _db_pool = queue.LifoQueue(maxsize=SQLITE_POOL_SIZE)
+        _db_pool_pid = os.getpid()
+    try:
+        return _db_pool.get_nowait()
+    except queue.Empty:
+        return _open_db()
+
+def _checkin_db(conn):
+    if conn.in_transaction:
+        conn.rollback()
+    if _db_pool_pid == os.getpid():
+        try:
+            _db_pool.put_nowait(conn)
+            return
+        except queue.Full:
+            pass
+    conn.close()
+
+def get_db():
+    """
+    Returns the pooled connection checked out for the current app context.
+    Do not close it; it goes back to the pool (with uncommitted work rolled
+    back) when the request or CLI command ends.
+    """
+    if 'db' not in g:
+        g.db = _checkout_db()
+    return g.db
+
+@app.teardown_appcontext
+def release_db(exc):
+    conn = g.pop('db', None)
+    if conn is not None:
+        _checkin_db(conn)
+
 # Database initialization
 def init_db():
-    conn = sqlite3.connect('bakery.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # Products table
@@ -87,6 +161,62 @@ def init_db():
         )
     ''')
     
+    # Daily sales rollups, kept current by the triggers in migration 2
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_sales (
+            day TEXT PRIMARY KEY,
+            revenue REAL NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_customers (
+            day TEXT NOT NULL,
+            customer_email TEXT NOT NULL,
+            PRIMARY KEY (day, customer_email)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_product_sales (
+            day TEXT NOT NULL,
+            product_id INTEGER NOT NULL,
+            quantity INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, product_id)
+        ) WITHOUT ROWID
+    ''')
+
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_category_sales (
+            day TEXT NOT NULL,
+            category TEXT NOT NULL,
+            items INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, category)
+        ) WITHOUT ROWID
+    ''')
+
+    # Per-table version counters, bumped by triggers; drive ETag / Last-Modified
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            name TEXT PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    for table in VERSIONED_TABLES:
+        cursor.execute('INSERT OR IGNORE INTO table_versions (name) VALUES (?)', (table,))
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            cursor.execute('''
+                CREATE TRIGGER IF NOT EXISTS {table}_version_{event_lower} AFTER {event} ON {table}
+                BEGIN
+                    UPDATE table_versions SET version = version + 1, updated_at = CURRENT_TIMESTAMP
+                    WHERE name = '{table}';
+                END
+            '''.format(table=table, event=event, event_lower=event.lower()))
+
     # Insert sample data if tables are empty
     cursor.execute('SELECT COUNT(*) FROM products')
     if cursor.fetchone()[0] == 0:
@@ -109,7 +239,7 @@ def init_db():
     # Insert admin user if not exists
     cursor.execute('SELECT COUNT(*) FROM admin_users')
     if cursor.fetchone()[0] == 0:
-        admin_password = hashlib.sha256('`{cooki£}267'.encode()).hexdigest()
+        admin_password = generate_password_hash('`{cooki£}267')
         cursor.execute('''
             INSERT INTO admin_users (username, email, password_hash)
             VALUES (?, ?, ?)
@@ -144,9 +274,193 @@ def init_db():
             INSERT INTO orders (customer_name, customer_email, customer_phone, total_amount, status)
             VALUES (?, ?, ?, ?, ?)
         ''', sample_orders)
-    
+
     conn.commit()
-    conn.close()
+    migrate(conn)
+
+# Sales rollups
+# Triggers on orders and order_items keep the rollups current whichever code
+# path writes an order. The statements below recompute them from history for
+# the first migration and `flask rebuild-rollups`; run that after editing or
+# deleting past orders, which the triggers do not track.
+ROLLUP_TRIGGERS = [
+    '''
+        CREATE TRIGGER IF NOT EXISTS orders_rollup_insert AFTER INSERT ON orders
+        BEGIN
+            INSERT INTO daily_sales (day, revenue, orders)
+            VALUES (date(NEW.order_date), NEW.total_amount, 1)
+            ON CONFLICT(day) DO UPDATE SET
+                revenue = revenue + excluded.revenue,
+                orders = orders + excluded.orders;
+            INSERT OR IGNORE INTO daily_customers (day, customer_email)
+            VALUES (date(NEW.order_date), NEW.customer_email);
+        END
+    ''',
+    '''
+        CREATE TRIGGER IF NOT EXISTS order_items_rollup_insert AFTER INSERT ON order_items
+        BEGIN
+            INSERT INTO daily_product_sales (day, product_id, quantity, revenue)
+            SELECT date(o.order_date), NEW.product_id, NEW.quantity, NEW.quantity * NEW.price
+            FROM orders o
+            WHERE o.id = NEW.order_id
+            ON CONFLICT(day, product_id) DO UPDATE SET
+                quantity = quantity + excluded.quantity,
+                revenue = revenue + excluded.revenue;
+            INSERT INTO daily_category_sales (day, category, items, revenue)
+            SELECT date(o.order_date), p.category, 1, NEW.quantity * NEW.price
+            FROM orders o
+            JOIN products p ON p.id = NEW.product_id
+            WHERE o.id = NEW.order_id
+            ON CONFLICT(day, category) DO UPDATE SET
+                items = items + excluded.items,
+                revenue = revenue + excluded.revenue;
+        END
+    '''
+]
+
+ROLLUP_STATEMENTS = [
+    '''
+        INSERT INTO daily_sales (day, revenue, orders)
+        SELECT date(o.order_date), SUM(o.total_amount), COUNT(*)
+        FROM orders o
+        GROUP BY date(o.order_date)
+    ''',
+    '''
+        INSERT INTO daily_customers (day, customer_email)
+        SELECT DISTINCT date(o.order_date), o.customer_email
+        FROM orders o
+    ''',
+    '''
+        INSERT INTO daily_product_sales (day, product_id, quantity, revenue)
+        SELECT date(o.order_date), oi.product_id, SUM(oi.quantity), SUM(oi.quantity * oi.price)
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.id
+        GROUP BY date(o.order_date), oi.product_id
+    ''',
+    '''
+        INSERT INTO daily_category_sales (day, category, items, revenue)
+        SELECT date(o.order_date), p.category, COUNT(oi.id), SUM(oi.quantity * oi.price)
+        FROM order_items oi
+        JOIN orders o ON oi.order_id = o.id
+        JOIN products p ON oi.product_id = p.id
+        GROUP BY date(o.order_date), p.category
+    '''
+]
+
+ROLLUP_TABLES = ['daily_sales', 'daily_customers', 'daily_product_sales', 'daily_category_sales']
+
+REBUILD_ROLLUPS = ['DELETE FROM {}'.format(table) for table in ROLLUP_TABLES] + ROLLUP_STATEMENTS
+
+def rebuild_rollups(cursor):
+    """Recomputes every rollup table from the full order history."""
+    for sql in REBUILD_ROLLUPS:
+        cursor.execute(sql)
+
+# Schema migrations
+# init_db() owns the base tables; everything after that is a numbered migration.
+# Entries are applied in order, each in its own transaction, and recorded in
+# schema_migrations. Never edit an applied entry - append a new one.
+MIGRATIONS = [
+    (1, 'Secondary indexes for dashboard, analytics and listing queries', [
+        'CREATE INDEX IF NOT EXISTS idx_orders_order_date ON orders (order_date)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_order_date ON orders (status, order_date)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_customer_email ON orders (customer_email)',
+        'CREATE INDEX IF NOT EXISTS idx_order_items_order_id ON order_items (order_id)',
+        'CREATE INDEX IF NOT EXISTS idx_order_items_product_id ON order_items (product_id)',
+        'CREATE INDEX IF NOT EXISTS idx_products_category ON products (category)',
+        'CREATE INDEX IF NOT EXISTS idx_products_created_at ON products (created_at)',
+        # Partial indexes: the dashboard only ever looks at active products
+        'CREATE INDEX IF NOT EXISTS idx_products_active_stock ON products (stock) WHERE is_active = 1',
+        'CREATE INDEX IF NOT EXISTS idx_products_active_category ON products (category) WHERE is_active = 1',
+        'CREATE INDEX IF NOT EXISTS idx_customers_loyalty_tier ON customers (loyalty_tier)',
+        'CREATE INDEX IF NOT EXISTS idx_customers_total_spent ON customers (total_spent)',
+        'CREATE INDEX IF NOT EXISTS idx_customers_last_order_date ON customers (last_order_date)',
+        'ANALYZE'
+    ]),
+    (2, 'Maintain the daily sales rollups with triggers', ROLLUP_TRIGGERS + REBUILD_ROLLUPS),
+    (3, 'Indexes for the remaining order and customer listing sorts', [
+        'CREATE INDEX IF NOT EXISTS idx_orders_total_amount ON orders (total_amount)',
+        'CREATE INDEX IF NOT EXISTS idx_orders_status_total_amount ON orders (status, total_amount)',
+        'CREATE INDEX IF NOT EXISTS idx_customers_created_at ON customers (created_at)',
+        'ANALYZE'
+    ])
+]
+
+def schema_version(cursor):
+    cursor.execute('SELECT COALESCE(MAX(version), 0) FROM schema_migrations')
+    return cursor.fetchone()[0]
+
+def migrate(conn):
+    """
+    Brings the database up to the latest migration and returns the version.
+    Safe to run on a live database: WAL keeps readers going, and each step
+    takes the write lock and re-checks the version, so concurrent workers
+    starting together apply every migration exactly once.
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT NOT NULL,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    conn.commit()
+
+    for version, description, statements in MIGRATIONS:
+        if version <= schema_version(cursor):
+            continue
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            if version > schema_version(cursor):
+                for sql in statements:
+                    cursor.execute(sql)
+                cursor.execute(
+                    'INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                    (version, description)
+                )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+    return schema_version(cursor)
+
+@app.cli.command('migrate')
+def migrate_command():
+    """Create missing tables and apply pending schema migrations."""
+    init_db()
+    print('Schema version {}'.format(schema_version(get_db().cursor())))
+
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    """Backfill the daily sales rollups from order history."""
+    init_db()
+    conn = get_db()
+    rebuild_rollups(conn.cursor())
+    conn.commit()
+    print('Rollups rebuilt')
+
+# Conditional GET
+VERSIONED_TABLES = ['products', 'orders', 'customers']
+
+def table_version(cursor, tables):
+    placeholders = ', '.join('?' for _ in tables)
+    cursor.execute(
+        'SELECT SUM(version), MAX(updated_at) FROM table_versions WHERE name IN ({})'.format(placeholders),
+        tables
+    )
+    version, updated_at = cursor.fetchone()
+    if updated_at:
+        updated_at = datetime.strptime(updated_at, '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+    return version or 0, updated_at
+
+def versioned_get(*tables):
+    """
+    Tags responses with an ETag built from the tables' version counters and
+    answers If-None-Match / If-Modified-Since with 304 before the view runs.
+    """
+    return conditional_get(lambda: table_version(get_db().cursor(), tables), '-'.join(tables))
 
 # Authentication decorator
 def login_required(f):
@@ -158,6 +472,28 @@ def login_required(f):
     return decorated_function
 
 # Admin Authentication Routes
+# Passwords used to be stored as bare SHA-256 hex digests; those still verify
+# and are replaced with a salted werkzeug hash on the next successful login.
+LEGACY_SHA256 = re.compile(r'[0-9a-f]{64}')
+
+# The werkzeug KDF runs in worker processes so it doesn't tie up request
+# threads; past max_pending admitted jobs, logins get a 503
+password_hasher = PasswordHasher(
+    generate_password_hash,
+    check_password_hash,
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2)),
+    max_pending=int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32)),
+    admit_timeout=float(os.getenv('PASSWORD_HASH_ADMIT_TIMEOUT', 0.5)),
+    timeout=float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+)
+
+def verify_password(stored_hash, password):
+    """Returns (matches, needs_rehash)."""
+    if LEGACY_SHA256.fullmatch(stored_hash):
+        matches = hmac.compare_digest(stored_hash, hashlib.sha256(password.encode()).hexdigest())
+        return matches, matches
+    return password_hasher.verify(stored_hash, password), False
+
 @app.route('/api/admin/login', methods=['POST'])
 def admin_login():
     data = request.get_json()
@@ -167,18 +503,29 @@ def admin_login():
     if not username_or_email or not password:
         return jsonify({'error': 'Username/email and password required'}), 400
     
-    conn = sqlite3.connect('bakery.db')
+    conn = get_db()
     cursor = conn.cursor()
     
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    
     cursor.execute('''
-        SELECT id, username, email FROM admin_users 
-        WHERE (LOWER(username) = ? OR LOWER(email) = ?) AND password_hash = ?
-    ''', (username_or_email, username_or_email, password_hash))
-    
-    admin = cursor.fetchone()
-    conn.close()
+        SELECT id, username, email, password_hash FROM admin_users 
+        WHERE LOWER(username) = ? OR LOWER(email) = ?
+    ''', (username_or_email, username_or_email))
+    
+    admin = None
+    try:
+        for row in cursor.fetchall():
+            ok, needs_rehash = verify_password(row[3], password)
+            if ok:
+                admin = row
+                if needs_rehash:
+                    cursor.execute('UPDATE admin_users SET password_hash = ? WHERE id = ?',
+                                   (password_hasher.hash(password), row[0]))
+                    conn.commit()
+                break
+    except HasherBusy as e:
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = '1'
+        return response, 503
     
     if admin:
         session['admin_id'] = admin[0]
@@ -217,8 +564,9 @@ def verify_admin():
 # Products API
 @app.route('/api/products', methods=['GET'])
 @login_required
+@versioned_get('products')
 def get_products():
-    conn = sqlite3.connect('bakery.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -243,7 +591,6 @@ def get_products():
             'updatedAt': row[10]
         })
     
-    conn.close()
     return jsonify(products)
 
 @app.route('/api/products', methods=['POST'])
@@ -251,7 +598,7 @@ def get_products():
 def add_product():
     data = request.get_json()
     
-    conn = sqlite3.connect('bakery.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -264,7 +611,6 @@ def add_product():
     
     product_id = cursor.lastrowid
     conn.commit()
-    conn.close()
     
     return jsonify({'id': product_id, 'message': 'Product added successfully'})
 
@@ -273,7 +619,7 @@ def add_product():
 def update_product(product_id):
     data = request.get_json()
     
-    conn = sqlite3.connect('bakery.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -286,87 +632,101 @@ def update_product(product_id):
     ))
     
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Product updated successfully'})
 
 @app.route('/api/products/<int:product_id>', methods=['DELETE'])
 @login_required
 def delete_product(product_id):
-    conn = sqlite3.connect('bakery.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     cursor.execute('DELETE FROM products WHERE id=?', (product_id,))
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Product deleted successfully'})
 
 # Analytics API
-@app.route('/api/analytics', methods=['GET'])
-@login_required
-def get_analytics():
-    conn = sqlite3.connect('bakery.db')
+def calc_change(current, previous):
+    if previous == 0:
+        return 100 if current > 0 else 0
+    return ((current - previous) / previous) * 100
+
+def window_bounds(days):
+    """Start dates (UTC, 'YYYY-MM-DD') of the current and previous `days`-long windows."""
+    today = datetime.utcnow().date()
+    current_start = (today - timedelta(days=days)).isoformat()
+    previous_start = (today - timedelta(days=days * 2)).isoformat()
+    return current_start, previous_start
+
+def compute_analytics(conn, days):
+    """
+    Builds the /api/analytics payload from the daily rollup tables,
+    so the cost depends on the number of days, not the number of orders.
+    """
     cursor = conn.cursor()
-    
-    # Get time range from query params
-    days = int(request.args.get('days', 7))
-    
-    # Revenue analytics
-    cursor.execute('''
-        SELECT SUM(total_amount) FROM orders 
-        WHERE order_date >= date('now', '-{} days')
-    '''.format(days))
-    current_revenue = cursor.fetchone()[0] or 0
-    
-    cursor.execute('''
-        SELECT SUM(total_amount) FROM orders 
-        WHERE order_date >= date('now', '-{} days') AND order_date < date('now', '-{} days')
-    '''.format(days * 2, days))
-    previous_revenue = cursor.fetchone()[0] or 0
-    
-    # Orders analytics
-    cursor.execute('''
-        SELECT COUNT(*) FROM orders 
-        WHERE order_date >= date('now', '-{} days')
-    '''.format(days))
-    current_orders = cursor.fetchone()[0] or 0
-    
-    cursor.execute('''
-        SELECT COUNT(*) FROM orders 
-        WHERE order_date >= date('now', '-{} days') AND order_date < date('now', '-{} days')
-    '''.format(days * 2, days))
-    previous_orders = cursor.fetchone()[0] or 0
-    
-    # Customer analytics
+    current_start, previous_start = window_bounds(days)
+    window = {'cur': current_start, 'prev': previous_start}
+
+    # Revenue and order count for both windows in a single pass
     cursor.execute('''
-        SELECT COUNT(DISTINCT customer_email) FROM orders 
-        WHERE order_date >= date('now', '-{} days')
-    '''.format(days))
-    current_customers = cursor.fetchone()[0] or 0
-    
+        SELECT
+            SUM(CASE WHEN day >= :cur THEN revenue END),
+            SUM(CASE WHEN day >= :cur THEN orders END),
+            SUM(CASE WHEN day < :cur THEN revenue END),
+            SUM(CASE WHEN day < :cur THEN orders END)
+        FROM daily_sales
+        WHERE day >= :prev
+    ''', window)
+    row = cursor.fetchone()
+    current_revenue = row[0] or 0
+    current_orders = row[1] or 0
+    previous_revenue = row[2] or 0
+    previous_orders = row[3] or 0
+
+    # Distinct customers are not additive across days, so count them from daily_customers
     cursor.execute('''
-        SELECT COUNT(DISTINCT customer_email) FROM orders 
-        WHERE order_date >= date('now', '-{} days') AND order_date < date('now', '-{} days')
-    '''.format(days * 2, days))
-    previous_customers = cursor.fetchone()[0] or 0
-    
+        SELECT
+            COUNT(DISTINCT CASE WHEN day >= :cur THEN customer_email END),
+            COUNT(DISTINCT CASE WHEN day < :cur THEN customer_email END)
+        FROM daily_customers
+        WHERE day >= :prev
+    ''', window)
+    row = cursor.fetchone()
+    current_customers = row[0] or 0
+    previous_customers = row[1] or 0
+
     # Average order value
     avg_current = current_revenue / current_orders if current_orders > 0 else 0
     avg_previous = previous_revenue / previous_orders if previous_orders > 0 else 0
-    
+
+    # Revenue by day
+    cursor.execute('''
+        SELECT day, revenue
+        FROM daily_sales
+        WHERE day >= ?
+        ORDER BY day
+    ''', (current_start,))
+
+    revenue_by_day = []
+    for row in cursor.fetchall():
+        day_name = datetime.strptime(row[0], '%Y-%m-%d').strftime('%a')
+        revenue_by_day.append({
+            'day': day_name,
+            'revenue': row[1]
+        })
+
     # Top products
     cursor.execute('''
-        SELECT p.name, SUM(oi.quantity) as sales, SUM(oi.quantity * oi.price) as revenue
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        JOIN orders o ON oi.order_id = o.id
-        WHERE o.order_date >= date('now', '-{} days')
+        SELECT p.name, SUM(d.quantity) as sales, SUM(d.revenue) as revenue
+        FROM daily_product_sales d
+        JOIN products p ON d.product_id = p.id
+        WHERE d.day >= ?
         GROUP BY p.id, p.name
         ORDER BY revenue DESC
         LIMIT 5
-    '''.format(days))
-    
+    ''', (current_start,))
+
     top_products = []
     for row in cursor.fetchall():
         top_products.append({
@@ -374,35 +734,16 @@ def get_analytics():
             'sales': row[1],
             'revenue': row[2]
         })
-    
-    # Revenue by day
-    cursor.execute('''
-        SELECT date(order_date) as day, SUM(total_amount) as revenue
-        FROM orders
-        WHERE order_date >= date('now', '-{} days')
-        GROUP BY date(order_date)
-        ORDER BY day
-    '''.format(days))
-    
-    revenue_by_day = []
-    for row in cursor.fetchall():
-        day_name = datetime.strptime(row[0], '%Y-%m-%d').strftime('%a')
-        revenue_by_day.append({
-            'day': day_name,
-            'revenue': row[1]
-        })
-    
+
     # Category performance
     cursor.execute('''
-        SELECT p.category, COUNT(oi.id) as orders, SUM(oi.quantity * oi.price) as revenue
-        FROM order_items oi
-        JOIN products p ON oi.product_id = p.id
-        JOIN orders o ON oi.order_id = o.id
-        WHERE o.order_date >= date('now', '-{} days')
-        GROUP BY p.category
+        SELECT category, SUM(items) as orders, SUM(revenue) as revenue
+        FROM daily_category_sales
+        WHERE day >= ?
+        GROUP BY category
         ORDER BY revenue DESC
-    '''.format(days))
-    
+    ''', (current_start,))
+
     category_performance = []
     for row in cursor.fetchall():
         category_performance.append({
@@ -410,14 +751,8 @@ def get_analytics():
             'orders': row[1],
             'revenue': row[2]
         })
-    
-    # Calculate percentage changes
-    def calc_change(current, previous):
-        if previous == 0:
-            return 100 if current > 0 else 0
-        return ((current - previous) / previous) * 100
-    
-    analytics = {
+
+    return {
         'revenue': {
             'current': current_revenue,
             'previous': previous_revenue,
@@ -442,15 +777,22 @@ def get_analytics():
         'revenueByDay': revenue_by_day,
         'categoryPerformance': category_performance
     }
-    
-    conn.close()
-    return jsonify(analytics)
+
+@app.route('/api/analytics', methods=['GET'])
+@login_required
+def get_analytics():
+    # Get time range from query params
+    days = int(request.args.get('days', 7))
+    if days < 1:
+        return jsonify({'error': 'days must be a positive integer'}), 400
+
+    return jsonify(compute_analytics(get_db(), days))
 
 # Dashboard Stats API
 @app.route('/api/dashboard/stats', methods=['GET'])
 @login_required
 def get_dashboard_stats():
-    conn = sqlite3.connect('bakery.db')
+    conn = get_db()
     cursor = conn.cursor()
     
     # Product stats
@@ -476,11 +818,10 @@ def get_dashboard_stats():
     # Today's revenue
     cursor.execute('''
         SELECT SUM(total_amount) FROM orders 
-        WHERE date(order_date) = date('now')
+        WHERE order_date >= date('now') AND order_date < date('now', '+1 day')
     ''')
     todays_revenue = cursor.fetchone()[0] or 0
     
-    conn.close()
     
     return jsonify({
         'totalProducts': total_products,
@@ -491,19 +832,102 @@ def get_dashboard_stats():
         'todaysRevenue': todays_revenue
     })
 
+# Admin listings: pagination, filters and sorting on indexed columns
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+ORDER_SORTS = {
+    'orderDate': 'order_date',
+    'totalAmount': 'total_amount',
+    'id': 'id'
+}
+
+CUSTOMER_SORTS = {
+    'totalSpent': 'total_spent',
+    'lastOrderDate': 'last_order_date',
+    'createdAt': 'created_at',
+    'id': 'id'
+}
+
+# Filtered totals, keyed by table version so any write makes them miss
+_count_cache = {}
+
+def cached_count(cursor, table, where, params):
+    version, _ = table_version(cursor, [table])
+    key = (table, where, tuple(params), version)
+    # Another request may clear the dict at any point, so a miss just recounts
+    count = _count_cache.get(key)
+    if count is None:
+        cursor.execute('SELECT COUNT(*) FROM {} {}'.format(table, where), params)
+        count = cursor.fetchone()[0]
+        if len(_count_cache) > 256:
+            _count_cache.clear()
+        _count_cache[key] = count
+    return count
+
+def parse_listing_args(sorts, default_sort):
+    """Returns (page, limit, order_by); raises ValueError for bad input."""
+    page = max(int(request.args.get('page', 1)), 1)
+    limit = min(max(int(request.args.get('limit', DEFAULT_PAGE_SIZE)), 1), MAX_PAGE_SIZE)
+    sort = request.args.get('sort', default_sort)
+    if sort not in sorts:
+        raise ValueError('sort must be one of: {}'.format(', '.join(sorts)))
+    direction = 'ASC' if request.args.get('order', 'desc').lower() == 'asc' else 'DESC'
+    order_by = '{col} {dir}, id {dir}'.format(col=sorts[sort], dir=direction)
+    return page, limit, order_by
+
+def parse_day(value, name):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        raise ValueError('{} must be a date in YYYY-MM-DD format'.format(name))
+
+def pagination_info(page, limit, total):
+    return {
+        'page': page,
+        'limit': limit,
+        'total': total,
+        'pages': (total + limit - 1) // limit
+    }
+
 # Orders API
 @app.route('/api/orders', methods=['GET'])
 @login_required
+@versioned_get('orders')
 def get_orders():
-    conn = sqlite3.connect('bakery.db')
+    """
+    Query params: page, limit (max 200), sort (orderDate|totalAmount|id),
+    order (asc|desc), status, from / to (YYYY-MM-DD, inclusive).
+    """
+    try:
+        page, limit, order_by = parse_listing_args(ORDER_SORTS, 'orderDate')
+        conditions = []
+        params = []
+        status = request.args.get('status')
+        if status and status != 'all':
+            conditions.append('status = ?')
+            params.append(status)
+        if request.args.get('from'):
+            conditions.append('order_date >= ?')
+            params.append(parse_day(request.args['from'], 'from'))
+        if request.args.get('to'):
+            conditions.append("order_date < date(?, '+1 day')")
+            params.append(parse_day(request.args['to'], 'to'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    conn = get_db()
     cursor = conn.cursor()
-    
+
+    total = cached_count(cursor, 'orders', where, params)
     cursor.execute('''
-        SELECT id, customer_name, customer_email, customer_phone, 
+        SELECT id, customer_name, customer_email, customer_phone,
                total_amount, status, order_date, updated_at
-        FROM orders ORDER BY order_date DESC
-    ''')
-    
+        FROM orders {} ORDER BY {} LIMIT ? OFFSET ?
+    '''.format(where, order_by), params + [limit, (page - 1) * limit])
+
     orders = []
     for row in cursor.fetchall():
         orders.append({
@@ -516,23 +940,45 @@ def get_orders():
             'orderDate': row[6],
             'updatedAt': row[7]
         })
-    
-    conn.close()
-    return jsonify(orders)
+
+    return jsonify({
+        'orders': orders,
+        'pagination': pagination_info(page, limit, total)
+    })
 
 # Customers API
 @app.route('/api/customers', methods=['GET'])
 @login_required
+@versioned_get('customers')
 def get_customers():
-    conn = sqlite3.connect('bakery.db')
+    """
+    Query params: page, limit (max 200), sort (totalSpent|lastOrderDate|createdAt|id),
+    order (asc|desc), tier (loyalty tier).
+    """
+    try:
+        page, limit, order_by = parse_listing_args(CUSTOMER_SORTS, 'totalSpent')
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conditions = []
+    params = []
+    tier = request.args.get('tier')
+    if tier and tier != 'all':
+        conditions.append('loyalty_tier = ?')
+        params.append(tier)
+
+    where = 'WHERE ' + ' AND '.join(conditions) if conditions else ''
+
+    conn = get_db()
     cursor = conn.cursor()
-    
+
+    total = cached_count(cursor, 'customers', where, params)
     cursor.execute('''
-        SELECT id, name, email, phone, address, total_orders, 
+        SELECT id, name, email, phone, address, total_orders,
                total_spent, loyalty_tier, created_at, last_order_date
-        FROM customers ORDER BY total_spent DESC
-    ''')
-    
+        FROM customers {} ORDER BY {} LIMIT ? OFFSET ?
+    '''.format(where, order_by), params + [limit, (page - 1) * limit])
+
     customers = []
     for row in cursor.fetchall():
         customers.append({
@@ -547,10 +993,13 @@ def get_customers():
             'createdAt': row[8],
             'lastOrderDate': row[9]
         })
-    
-    conn.close()
-    return jsonify(customers)
+
+    return jsonify({
+        'customers': customers,
+        'pagination': pagination_info(page, limit, total)
+    })
 
 if __name__ == '__main__':
-    init_db()
+    with app.app_context():
+        init_db()
     app.run(debug=True, port=5000)
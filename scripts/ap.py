@@ -2,7 +2,8 @@ from flask import *
 from flask_cors import CORS
 from flask_jwt_extended import *
 from werkzeug.security import *
-from pymongo import MongoClient
+from pymongo import MongoClient, IndexModel
+from pymongo.errors import PyMongoError
 from bson import ObjectId
 from datetime import *
 import os
@@ -10,6 +11,9 @@ from werkzeug.utils import secure_filename
 from functools import wraps
 from dotenv import load_dotenv
 import re
+from catalog_cache import Catalog, MISSING
+from mongo_indexes import ensure_indexes, explain_queries, print_report
+from stock_status import backfill_stock_status, stock_status
 
 # Import admin routes
 # from admin_routes import admin_bp
@@ -45,6 +49,70 @@ products_collection = db['products']
 categories_collection = db['categories']
 orders_collection = db['orders']
 admin_users_collection = db['admin_users']
+catalog_meta_collection = db['catalog_meta']
+
+# Indexes for the queries the routes below issue; created idempotently on startup
+# (best effort) and by `flask ensure-indexes`, which also explains QUERY_PROBES
+INDEXES = {
+    'products': [
+        # Text index backing product search; stems English words so "croissants" finds "Croissant"
+        IndexModel([('name', 'text'), ('description', 'text')], name='products_text',
+                   weights={'name': 10, 'description': 2}, default_language='english'),
+        IndexModel([('isActive', 1), ('category', 1), ('name', 1)], name='products_active_category_name'),
+        IndexModel([('isActive', 1), ('name', 1)], name='products_active_name'),
+        IndexModel([('isActive', 1), ('price', 1)], name='products_active_price'),
+        IndexModel([('isActive', 1), ('rating', -1)], name='products_active_rating'),
+        IndexModel([('isActive', 1), ('createdAt', -1)], name='products_active_created'),
+        IndexModel([('category_id', 1), ('isActive', 1), ('_id', 1)], name='products_category_id'),
+        IndexModel([('stock', 1)], name='products_stock')
+    ],
+    'categories': [
+        IndexModel([('isActive', 1), ('name', 1)], name='categories_active_name'),
+        IndexModel([('name', 1)], name='categories_name')
+    ],
+    'orders': [
+        IndexModel([('created_at', -1)], name='orders_created_at'),
+        IndexModel([('userId', 1), ('createdAt', -1)], name='orders_user_created')
+    ],
+    'users': [IndexModel([('email', 1)], name='users_email')],
+    'admin_users': [IndexModel([('username', 1)], name='admin_users_username')]
+}
+
+QUERY_PROBES = [
+    {'label': 'GET /api/products', 'collection': 'products',
+     'filter': {'isActive': True}, 'sort': {'name': 1}},
+    {'label': 'GET /api/products?category', 'collection': 'products',
+     'filter': {'isActive': True, 'category': 'Cakes'}, 'sort': {'name': 1}},
+    {'label': 'GET /api/products?category&sort=price-low', 'collection': 'products',
+     'filter': {'isActive': True, 'category': 'Cakes'}, 'sort': {'price': 1}},
+    {'label': 'GET /api/products?sort=newest', 'collection': 'products',
+     'filter': {'isActive': True}, 'sort': {'createdAt': -1}},
+    {'label': 'GET /api/categories products lookup', 'collection': 'products',
+     'filter': {'category_id': ObjectId(), 'isActive': True}, 'sort': {'_id': 1}},
+    {'label': 'GET /api/categories', 'collection': 'categories',
+     'filter': {'isActive': True}, 'sort': {'name': 1}},
+    {'label': 'POST /api/add_products category', 'collection': 'categories',
+     'filter': {'name': 'Cakes'}},
+    {'label': 'dashboard recent orders', 'collection': 'orders',
+     'filter': {}, 'sort': {'created_at': -1}},
+    {'label': 'dashboard low stock', 'collection': 'products',
+     'filter': {'stock': {'$lt': 10}}},
+    {'label': 'signup / signin', 'collection': 'users',
+     'filter': {'email': 'someone@example.com'}},
+    {'label': 'admin login', 'collection': 'admin_users',
+     'filter': {'username': 'admin'}}
+]
+
+def bootstrap_indexes():
+    """Create INDEXES on startup without letting an unreachable MongoDB stop the app."""
+    try:
+        _, errors = ensure_indexes(db, INDEXES)
+    except PyMongoError as e:
+        app.logger.warning('Index bootstrap skipped, MongoDB unavailable: %s', e)
+        return
+    for collection, message in errors.items():
+        app.logger.warning('Indexes on %s not created: %s', collection, message)
+
 def init_database():
     """Initialize database with sample data"""
     print("🔄 Initializing database...")
@@ -57,6 +125,34 @@ def init_database():
         'created_at': datetime.now()
     })
 
+# Catalog version: bumped on every catalog write, drives ETag / Last-Modified
+def load_catalog_version():
+    doc = catalog_meta_collection.find_one({'_id': 'catalog'}) or {}
+    updated_at = doc.get('updatedAt')
+    return doc.get('version', 0), updated_at.replace(tzinfo=timezone.utc) if updated_at else None
+
+def bump_catalog_version():
+    catalog_meta_collection.update_one(
+        {'_id': 'catalog'},
+        {'$inc': {'version': 1}, '$currentDate': {'updatedAt': True}},
+        upsert=True
+    )
+
+# Product rows, listing pages and category maps; add_products invalidates them.
+# The version is read at most once per CATALOG_VERSION_TTL seconds per worker,
+# so cache hits don't pay a Mongo round trip.
+catalog = Catalog(
+    load_catalog_version,
+    namespaces=('products', 'categories'),
+    max_entries=int(os.getenv('CATALOG_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('CATALOG_CACHE_TTL', 300)),
+    version_ttl=float(os.getenv('CATALOG_VERSION_TTL', 2))
+)
+catalog_cache = catalog.cache
+catalog_conditional = catalog.conditional
+invalidate_catalog = catalog.invalidate
+request_cache_key = catalog.request_key
+
 # Helper function to convert ObjectId to string
 def convert_objectids(obj):
     if isinstance(obj, ObjectId):
@@ -215,10 +311,14 @@ def add_products():
             'description': description,
             'image': image_filename,
             'isActive': True,
+            # No stock is recorded at creation; keeps the admin stock filters in step
+            'stockStatus': stock_status(0),
             'createdAt': datetime.now()
         }
 
         result = products_collection.insert_one(new_product)
+        bump_catalog_version()
+        invalidate_catalog()
 
         return jsonify({
             'messaage':'Product addedd successfully',
@@ -237,8 +337,14 @@ def add_products():
 
 
 @app.route('/api/products', methods=['GET'])
+@catalog_conditional
 def get_products():
     try:
+        cache_key = request_cache_key()
+        cached = catalog_cache.get('products', cache_key)
+        if cached is not MISSING:
+            return jsonify(cached), 200
+
         category = request.args.get('category')
         sort_by = request.args.get('sort', 'name')
         page = int(request.args.get('page', 1))
@@ -249,11 +355,11 @@ def get_products():
         query = {'isActive': True}
         if category:
             query['category'] = category
+        projection = None
         if search:
-            query['$or'] = [
-                {'name': {'$regex': search, '$options': 'i'}},
-                {'description': {'$regex': search, '$options': 'i'}}
-            ]
+            query['$text'] = {'$search': search}
+            if 'sort' not in request.args:
+                sort_by = 'relevance'
         
         # Sort options
         sort_options = {
@@ -264,17 +370,23 @@ def get_products():
             'newest': [('createdAt', -1)]
         }
         
-        sort_criteria = sort_options.get(sort_by, [('name', 1)])
+        if sort_by == 'relevance' and search:
+            projection = {'score': {'$meta': 'textScore'}}
+            sort_criteria = [('score', {'$meta': 'textScore'})]
+        else:
+            sort_criteria = sort_options.get(sort_by, [('name', 1)])
         
         # Execute query with pagination
         skip = (page - 1) * limit
-        cursor = (products_collection.find(query).sort(sort_criteria).skip(skip).limit(limit))
+        cursor = (products_collection.find(query, projection).sort(sort_criteria).skip(skip).limit(limit))
         docs = list(cursor)
+        for doc in docs:
+            doc.pop('score', None)
         total = products_collection.count_documents(query)
 
         safe_docs = convert_objectids(docs)
         
-        return jsonify({
+        payload = {
             'products': safe_docs,
             'pagination': {
                 'page': page,
@@ -282,39 +394,88 @@ def get_products():
                 'total': total,
                 'pages': (total + limit - 1) // limit
             }
-        }), 200
+        }
+        catalog_cache.set('products', cache_key, payload)
+        return jsonify(payload), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/products/<product_id>', methods=['GET'])
+@catalog_conditional
 def get_product(product_id):
     try:
+        version = getattr(g, 'catalog_version', None)
+        cached = catalog_cache.get('product', product_id)
+        # Entries written under an older catalog version may predate another worker's write
+        if cached is not MISSING and cached[0] == version:
+            return jsonify({'product': cached[1]}), 200
+
         product = products_collection.find_one({'_id': ObjectId(product_id), 'isActive': True})
         
         if not product:
             return jsonify({'error': 'Product not found'}), 404
         
-        return jsonify({'product': convert_objectids(product)}), 200
+        product = convert_objectids(product)
+        catalog_cache.set('product', product_id, (version, product))
+        return jsonify({'product': product}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Product fields that may be requested through ?fields=; anything else is a 400
+# rather than an operator or path injected into $project
+CATEGORY_PRODUCT_FIELDS = {
+    '_id', 'name', 'price', 'category_id', 'category_name', 'description',
+    'image', 'isActive', 'stock', 'lowStockThreshold', 'stockStatus', 'createdAt', 'rating'
+}
+
 @app.route('/api/categories', methods=['GET'])
+@catalog_conditional
 def get_categories():
     try:
-        categories = list(categories_collection.find({'isActive': True}).sort('name', 1))
-        enriched_categories = []
-        for cat in categories:
-            cat_id = cat['_id']
-            products = list(products_collection.find({
-                'category_id':cat_id,
-                'isActive': True
-            }))
-            products = [convert_objectids(p) for p in products]
-            cat['products'] = products
-            enriched_categories.append(convert_objectids(cat))
-        return jsonify({'categories': enriched_categories}), 200
+        cache_key = request_cache_key()
+        cached = catalog_cache.get('categories', cache_key)
+        if cached is not MISSING:
+            return jsonify({'categories': cached}), 200
+
+        # Optional: ?limit=N products per category, ?fields=name,price to trim products
+        limit = request.args.get('limit', type=int)
+        fields = request.args.get('fields')
+
+        projection = None
+        if fields:
+            requested = [f.strip() for f in fields.split(',') if f.strip()]
+            unknown = [f for f in requested if f not in CATEGORY_PRODUCT_FIELDS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+            projection = {f: 1 for f in requested}
+
+        product_pipeline = [
+            {'$match': {'$expr': {'$eq': ['$category_id', '$$cat_id']}, 'isActive': True}},
+            {'$sort': {'_id': 1}}
+        ]
+        if limit is not None and limit > 0:
+            product_pipeline.append({'$limit': limit})
+        if projection:
+            product_pipeline.append({'$project': projection})
+
+        # One aggregation joins every category to its products
+        categories = list(categories_collection.aggregate([
+            {'$match': {'isActive': True}},
+            {'$sort': {'name': 1}},
+            {
+                '$lookup': {
+                    'from': 'products',
+                    'let': {'cat_id': '$_id'},
+                    'pipeline': product_pipeline,
+                    'as': 'products'
+                }
+            }
+        ]))
+        categories = convert_objectids(categories)
+        catalog_cache.set('categories', cache_key, categories)
+        return jsonify({'categories': categories}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -423,6 +584,19 @@ def get_analytics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/admin/cache', methods=['GET'])
+def get_catalog_cache_stats():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return jsonify({'cache': catalog_cache.stats()}), 200
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes_command():
+    """Create the declared indexes, backfill stockStatus and flag route queries that still COLLSCAN."""
+    created, errors = ensure_indexes(db, INDEXES)
+    print(f'stockStatus set on {backfill_stock_status(products_collection)} product(s)')
+    print_report(created, errors, explain_queries(db, QUERY_PROBES))
+
 # Mpesa Payment Route
 import requests # Handles HTTP requests
 import datetime # Works with date and time
@@ -496,6 +670,7 @@ def mpesa_payment():
         # Give a JSON Response to the user
         return jsonify({"message": "An MPESA Prompt has been sent to Your Phone, Please Check & Complete Payment"})
 
+bootstrap_indexes()
 app.run(debug=True)
 
 
@@ -8,12 +8,30 @@ from flask_jwt_extended import (
     JWTManager, create_access_token, jwt_required, get_jwt_identity
 )
 from werkzeug.security import generate_password_hash, check_password_hash
-from werkzeug.utils import secure_filename
+from werkzeug.utils import safe_join
 from dotenv import load_dotenv
 import json
-# import base64
+import base64
+import hashlib
+import hmac
+import math
+import mimetypes
+import threading
+import time
+import uuid
+from urllib.parse import quote
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+from datetime import date, timezone
 # from requests.auth import HTTPBasicAuth
 import pymysql
+from db_pool import ConnectionPool
+from catalog_cache import Catalog, CatalogCache, MISSING
+from order_queue import GroupCommitQueue, QueueFull
+from password_pool import HasherBusy, PasswordHasher
+from mpesa import MpesaClient, MpesaError
+from circuit_breaker import CircuitBreaker, CircuitOpen
+from image_pipeline import FORMATS, VARIANTS, UploadTooLarge, load_manifest, process_image, save_upload, variant_dir
 
 # ------------- Load environment variables -------------
 load_dotenv()
@@ -44,30 +62,221 @@ CORS(app, supports_credentials=True, origins=["http://localhost:3000"])
 
 # ------------- Database helper -------------
 
+DB_CONFIG = {
+    'host': os.getenv('DB_HOST', "echoschribbie.mysql.pythonanywhere-services.com"),
+    'user': os.getenv('DB_USER', "echoschribbie"),
+    'password': os.getenv('DB_PASSWORD', "sweetdelights342"),
+    'db': os.getenv('DB_NAME', "echoschribbie$sweetdelightsdb"),
+    'charset': "utf8mb4",
+    'cursorclass': pymysql.cursors.DictCursor,
+    'autocommit': False  # we will commit manually
+}
+
+def _connect():
+    return pymysql.connect(**DB_CONFIG)
+
+# PythonAnywhere drops idle MySQL connections after ~300s, so recycle before that.
+# When this file is run directly, the spawned hashing and image workers re-import
+# it as __mp_main__; they never query MySQL, so they skip the warm-up.
+db_pool = ConnectionPool(
+    _connect,
+    min_size=int(os.getenv('DB_POOL_MIN', 2)),
+    max_size=int(os.getenv('DB_POOL_MAX', 10)),
+    timeout=float(os.getenv('DB_POOL_TIMEOUT', 10)),
+    recycle=int(os.getenv('DB_POOL_RECYCLE', 280)),
+    ping_on_borrow=os.getenv('DB_POOL_PING', '1') == '1',
+    warm=__name__ != '__mp_main__'
+)
+
 def get_db():
     """
-    Returns a new PyMySQL connection.
-    Caller must close it after use.
+    Returns a PyMySQL connection checked out from db_pool.
+    Caller must close it after use; close() hands it back to the pool.
     """
-    conn = pymysql.connect(
-        host="echoschribbie.mysql.pythonanywhere-services.com",
-        user="echoschribbie",
-        password="sweetdelights342",
-        db="echoschribbie$sweetdelightsdb",
-        charset="utf8mb4",
-        cursorclass=pymysql.cursors.DictCursor,
-        autocommit=False  # we will commit manually
-    )
-    return conn
+    return db_pool.acquire()
+
+# ------------- Catalog version, cache and conditional GET -------------
+
+# One-row table bumped in the same transaction as every catalog write.
+# Its version drives ETags and its updated_at drives Last-Modified.
+def ensure_catalog_version(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS catalog_version (
+                id TINYINT PRIMARY KEY,
+                version BIGINT NOT NULL,
+                updated_at DATETIME NOT NULL
+            )
+        """)
+        cursor.execute("INSERT IGNORE INTO catalog_version (id, version, updated_at) VALUES (1, 1, UTC_TIMESTAMP())")
+    conn.commit()
+
+def bump_catalog_version(cursor):
+    cursor.execute("UPDATE catalog_version SET version = version + 1, updated_at = UTC_TIMESTAMP() WHERE id = 1")
+
+def load_catalog_version():
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute("SELECT version, updated_at FROM catalog_version WHERE id = 1")
+            row = cursor.fetchone()
+    except pymysql.err.ProgrammingError as e:
+        raise RuntimeError('catalog_version table is missing; run `flask --app app ensure-schema`') from e
+    finally:
+        conn.close()
+    if not row:
+        return 0, None
+    return row['version'], row['updated_at'].replace(tzinfo=timezone.utc)
+
+# Product rows, listing pages and category maps; admin writes invalidate them.
+# Each worker has its own cache, so the TTL bounds staleness across workers.
+# The version is read at most once per CATALOG_VERSION_TTL seconds per worker,
+# so cache hits don't pay a MySQL round trip.
+catalog = Catalog(
+    load_catalog_version,
+    namespaces=('products', 'product_count', 'categories'),
+    max_entries=int(os.getenv('CATALOG_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('CATALOG_CACHE_TTL', 300)),
+    version_ttl=float(os.getenv('CATALOG_VERSION_TTL', 2))
+)
+catalog_cache = catalog.cache
+catalog_conditional = catalog.conditional
+invalidate_catalog = catalog.invalidate
+request_cache_key = catalog.request_key
+
+# ------------- Password hashing -------------
+
+# KDF work runs in worker processes; when max_pending jobs are already admitted,
+# further sign-ins get a 503 instead of piling up behind them.
+password_hasher = PasswordHasher(
+    generate_password_hash,
+    check_password_hash,
+    workers=int(os.getenv('PASSWORD_HASH_WORKERS', os.cpu_count() or 2)),
+    max_pending=int(os.getenv('PASSWORD_HASH_MAX_PENDING', 32)),
+    admit_timeout=float(os.getenv('PASSWORD_HASH_ADMIT_TIMEOUT', 0.5)),
+    timeout=float(os.getenv('PASSWORD_HASH_TIMEOUT', 10))
+)
+
+def hasher_busy_response(e):
+    resp = jsonify({'error': str(e)})
+    resp.headers['Retry-After'] = '1'
+    return resp, 503
 
 # ------------- Utility functions -------------
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-@app.route('/uploads/<filename>')
+# ------------- Uploads -------------
+
+# Content-hashed uploads (see Image pipeline) never change under the same URL,
+# so browsers keep them for a year without revalidating. Older, name-based files
+# get a short lifetime and revalidate with ETag / Last-Modified. Range requests
+# and conditional GETs are answered by send_from_directory.
+#
+# UPLOADS_SENDFILE=x-accel hands the bytes to nginx with X-Accel-Redirect
+# (UPLOADS_ACCEL_PREFIX must be an internal location aliased to UPLOAD_FOLDER);
+# UPLOADS_SENDFILE=x-sendfile does the same for Apache/lighttpd via X-Sendfile.
+UPLOADS_SENDFILE = os.getenv('UPLOADS_SENDFILE', '')
+UPLOADS_ACCEL_PREFIX = os.getenv('UPLOADS_ACCEL_PREFIX', '/protected-uploads/')
+UPLOADS_IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+UPLOADS_MUTABLE_MAX_AGE = int(os.getenv('UPLOADS_MUTABLE_MAX_AGE', 3600))
+# Only the originals and rendered variants are immutable; manifest.json is rewritten
+IMMUTABLE_UPLOAD_REGEX = re.compile(
+    r'[0-9a-f]{64}\.[a-z]+|variants/[0-9a-f]{64}/(?:%s)\.(?:%s)'
+    % ('|'.join(VARIANTS), '|'.join(FORMATS))
+)
+app.config['USE_X_SENDFILE'] = UPLOADS_SENDFILE == 'x-sendfile'
+
+@app.route('/uploads/<path:filename>')
 def uploaded_file(filename):
-    return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+    immutable = IMMUTABLE_UPLOAD_REGEX.fullmatch(filename) is not None
+    max_age = UPLOADS_IMMUTABLE_MAX_AGE if immutable else UPLOADS_MUTABLE_MAX_AGE
+
+    if UPLOADS_SENDFILE == 'x-accel':
+        path = safe_join(app.config['UPLOAD_FOLDER'], filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        resp = Response(mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = UPLOADS_ACCEL_PREFIX + quote(filename)
+    else:
+        # A hashed path names its content, so it is a strong ETag on its own
+        etag = filename.replace('/', '-') if immutable else True
+        resp = send_from_directory(app.config['UPLOAD_FOLDER'], filename,
+                                   max_age=max_age, etag=etag, conditional=True)
+
+    resp.headers['Cache-Control'] = f'public, max-age={max_age}' + (', immutable' if immutable else '')
+    return resp
+
+# ------------- Image pipeline -------------
+
+# Uploads are stored as <content hash>.<ext>; a process pool renders resized
+# WebP/JPEG variants and a blur placeholder under uploads/variants/<hash>/.
+IMAGE_MAX_BYTES = int(os.getenv('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+# Keys are the full sha256 of the upload
+IMAGE_KEY_REGEX = re.compile(r'([0-9a-f]{64})\.[a-z]+')
+_image_pool = None
+_image_pool_pid = None
+_image_pool_lock = threading.Lock()
+# Finished manifests never change, so entries live long; the LRU bound keeps memory flat
+image_manifests = CatalogCache(
+    max_entries=int(os.getenv('IMAGE_MANIFEST_CACHE_SIZE', 2048)),
+    ttl=24 * 3600
+)
+
+def image_pool():
+    global _image_pool, _image_pool_pid
+    with _image_pool_lock:
+        if _image_pool is None or _image_pool_pid != os.getpid():
+            _image_pool = ProcessPoolExecutor(
+                max_workers=int(os.getenv('IMAGE_WORKERS', 2)),
+                mp_context=multiprocessing.get_context('spawn')
+            )
+            _image_pool_pid = os.getpid()
+        return _image_pool
+
+def on_image_processed(future):
+    if future.exception():
+        app.logger.warning('Image processing failed: %s', future.exception())
+        return
+    # Listings cached while the variants were missing must be rebuilt, in every worker
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            bump_catalog_version(cursor)
+        conn.commit()
+    finally:
+        conn.close()
+    invalidate_catalog()
+
+def schedule_image_processing(key, filename):
+    future = image_pool().submit(
+        process_image,
+        os.path.join(UPLOAD_FOLDER, filename),
+        variant_dir(UPLOAD_FOLDER, key)
+    )
+    future.add_done_callback(on_image_processed)
+
+def image_urls(filename):
+    """Variant URLs and placeholder for a stored image, or None until they exist."""
+    match = IMAGE_KEY_REGEX.fullmatch(filename or '')
+    if not match:
+        return None  # uploaded before the pipeline existed
+    key = match.group(1)
+    manifest = image_manifests.get('manifest', key)
+    if manifest is MISSING:
+        manifest = load_manifest(UPLOAD_FOLDER, key)
+        if manifest is None or 'error' in manifest:
+            return None
+        image_manifests.set('manifest', key, manifest)
+    urls = {'placeholder': manifest['placeholder'], 'width': manifest['width'], 'height': manifest['height']}
+    for name, variant in manifest['variants'].items():
+        urls[name] = {
+            'width': variant['width'],
+            'height': variant['height'],
+            **{fmt: f"/uploads/variants/{key}/{name}.{fmt}" for fmt in variant['formats']}
+        }
+    return urls
 
 # ------------- Routes -------------
 
@@ -92,6 +301,10 @@ def signup():
         if not re.match(EMAIL_REGEX, email):
             return jsonify({'error': 'Invalid email format'}), 400
 
+        # Hash before checking out a connection so a pooled connection
+        # isn't held while waiting on the hash pool
+        hashed = password_hasher.hash(password)
+
         conn = get_db()
         try:
             with conn.cursor() as cursor:
@@ -101,7 +314,6 @@ def signup():
                     return jsonify({'error': 'User already exists'}), 400
 
                 # Insert new user; initialize JSON columns as empty arrays
-                hashed = generate_password_hash(password)
                 now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
                 cursor.execute("""
                     INSERT INTO users
@@ -127,10 +339,22 @@ def signup():
             }
         }), 201
 
+    except HasherBusy as e:
+        return hasher_busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Unified login route: admin or normal user
+def fetch_login_row(sql, identifier):
+    """One lookup on its own checkout, so no connection is held while a hash is verified."""
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(sql, (identifier,))
+            return cursor.fetchone()
+    finally:
+        conn.close()
+
 @app.route('/api/signin', methods=['POST'])
 def unified_login():
     data = request.get_json() or {}
@@ -139,16 +363,13 @@ def unified_login():
     if not identifier or not password:
         return jsonify({'error': 'Identifier and password required'}), 400
 
-    conn = get_db()
     try:
         # 1. Try admin login by username
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT id, username, password, email, role FROM admin_users WHERE username=%s",
-                (identifier,)
-            )
-            admin = cursor.fetchone()
-        if admin and check_password_hash(admin['password'], password):
+        admin = fetch_login_row(
+            "SELECT id, username, password, email, role FROM admin_users WHERE username=%s",
+            identifier
+        )
+        if admin and password_hasher.verify(admin['password'], password):
             # Create JWT with admin role
             access_token = create_access_token(
                 identity=str(admin['id']),
@@ -176,13 +397,11 @@ def unified_login():
             return jsonify({'error': 'Invalid email format'}), 400
 
         # 3. Try normal user login
-        with conn.cursor() as cursor:
-            cursor.execute(
-                "SELECT id, first_name, last_name, email, password, is_active FROM users WHERE email=%s",
-                (identifier.lower(),)
-            )
-            user = cursor.fetchone()
-        if user and check_password_hash(user['password'], password):
+        user = fetch_login_row(
+            "SELECT id, first_name, last_name, email, password, is_active FROM users WHERE email=%s",
+            identifier.lower()
+        )
+        if user and password_hasher.verify(user['password'], password):
             if not user.get('is_active', True):
                 return jsonify({'error': 'Account is deactivated'}), 401
             user_id = str(user['id'])
@@ -205,10 +424,10 @@ def unified_login():
 
         return jsonify({'error': 'Invalid credentials'}), 401
 
+    except HasherBusy as e:
+        return hasher_busy_response(e)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-    finally:
-        conn.close()
 
 
 # Profile route
@@ -289,9 +508,17 @@ def add_products():
         if not image or not allowed_file(image.filename):
             return jsonify({'error': 'Invalid or missing image file'}), 400
 
-        # Save image
-        filename = secure_filename(image.filename)
-        image.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
+        # Stream to disk under its content hash; variants are rendered off the request path
+        ext = image.filename.rsplit('.', 1)[1].lower()
+        if ext in ('jpeg', 'jfif'):
+            ext = 'jpg'
+        try:
+            image_key, filename, _ = save_upload(image.stream, app.config['UPLOAD_FOLDER'], ext, IMAGE_MAX_BYTES)
+        except UploadTooLarge as e:
+            return jsonify({'error': str(e)}), 413
+        # Also covers a duplicate whose earlier processing never finished
+        if load_manifest(app.config['UPLOAD_FOLDER'], image_key) is None:
+            schedule_image_processing(image_key, filename)
 
         conn = get_db()
         try:
@@ -319,85 +546,282 @@ def add_products():
                       (name, price, category_id, description, image, is_active, created_at, rating, stock)
                     VALUES (%s, %s, %s, %s, %s, TRUE, %s, 0, 0)
                 """, (name.strip(), float(price), category_id, description.strip(), filename, now))
+                bump_catalog_version(cursor)
                 conn.commit()
                 product_id = cursor.lastrowid
 
         finally:
             conn.close()
 
+        invalidate_catalog()
+
         return jsonify({
             'message': 'Product added successfully',
             'product_id': product_id,
-            'image_url': f"/uploads/{filename}"
+            'image_url': f"/uploads/{filename}",
+            'images': image_urls(filename)
         }), 201
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # 5. Get products list with pagination, filtering, sorting
+# Allowed sorts: name (alphabetical), price-low, price-high, rating, newest.
+# Each maps to (column, direction); p.id breaks ties so keyset pages are stable.
+PRODUCT_SORTS = {
+    'name': ('name', 'ASC'),
+    'price-low': ('price', 'ASC'),
+    'price-high': ('price', 'DESC'),
+    'rating': ('rating', 'DESC'),
+    'newest': ('created_at', 'DESC'),
+    # Only used with ?search=; ordered by FULLTEXT score
+    'relevance': (None, 'DESC')
+}
+
+# Full-text search
+# products needs: ALTER TABLE products ADD FULLTEXT INDEX ft_products_search (name, description)
+# (created by ensure_search_index / `flask ensure-schema`).
+FULLTEXT_MIN_TOKEN = 3  # InnoDB innodb_ft_min_token_size default
+SEARCH_TOKEN_REGEX = re.compile(r'[a-z0-9]+')
+
+def search_variants(word):
+    """
+    Prefixes that together match the singular and plural spellings of a word.
+    Both the -ie and -y singulars are kept for -ies plurals, and -ves plurals
+    also try -f, so catalog names match either way:
+
+    >>> names = ['Chocolate Chip Cookie', 'Fudge Brownie', 'Mango Smoothie',
+    ...          'Sourdough Loaf', 'Mixed Berry Tart', 'Butter Croissant', 'Gift Box']
+    >>> def found(search):
+    ...     prefixes = search_variants(search)
+    ...     return [n for n in names if any(w.startswith(prefixes) for w in n.lower().split())]
+    >>> found('cookies'), found('brownies'), found('smoothies')
+    (['Chocolate Chip Cookie'], ['Fudge Brownie'], ['Mango Smoothie'])
+    >>> found('loaves'), found('berries'), found('croissants'), found('boxes')
+    (['Sourdough Loaf'], ['Mixed Berry Tart'], ['Butter Croissant'], ['Gift Box'])
+    """
+    if len(word) > 4 and word.endswith('ies'):
+        variants = (word[:-1], word[:-3] + 'y')
+    elif len(word) > 4 and word.endswith('ves'):
+        variants = (word[:-1], word[:-3] + 'f')
+    elif len(word) > 4 and word.endswith(('ches', 'shes', 'sses', 'xes', 'zes')):
+        variants = (word[:-2],)
+    elif len(word) > 3 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        variants = (word[:-1],)
+    elif len(word) > 3 and word.endswith('y'):
+        # berry* does not prefix-match berries
+        variants = (word, word[:-1] + 'ie')
+    else:
+        variants = (word,)
+    return tuple(v for v in variants if len(v) >= FULLTEXT_MIN_TOKEN)
+
+def fulltext_query(search):
+    """
+    Turns free text into a BOOLEAN MODE query where every term is required
+    and any of its prefix variants may match, so 'cookies' also finds 'Cookie'.
+    Returns None when no term is long enough for the FULLTEXT index.
+    """
+    terms = []
+    for word in SEARCH_TOKEN_REGEX.findall(search.lower()):
+        variants = search_variants(word)
+        if not variants or variants in terms:
+            continue
+        terms.append(variants)
+    if not terms:
+        return None
+    parts = []
+    for variants in terms:
+        if len(variants) > 1:
+            parts.append('+(' + ' '.join(f'{v}*' for v in variants) + ')')
+        else:
+            parts.append(f'+{variants[0]}*')
+    return ' '.join(parts)
+
+def ensure_search_index(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'products'
+              AND index_name = 'ft_products_search'
+            LIMIT 1
+        """)
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE products ADD FULLTEXT INDEX ft_products_search (name, description)")
+    conn.commit()
+
+# Keyset pages seek into (is_active, sort column, id) instead of scanning and
+# filesorting every active product
+PRODUCT_SORT_INDEXES = {
+    'idx_products_active_name': '(is_active, name, id)',
+    'idx_products_active_price': '(is_active, price, id)',
+    'idx_products_active_rating': '(is_active, rating, id)',
+    'idx_products_active_created': '(is_active, created_at, id)'
+}
+
+def ensure_product_sort_indexes(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT DISTINCT index_name AS name FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'products'
+        """)
+        existing = {row['name'] for row in cursor.fetchall()}
+        for name, columns in PRODUCT_SORT_INDEXES.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE products ADD INDEX {name} {columns}")
+    conn.commit()
+
+# Listing totals are cached briefly so paging doesn't re-count the catalog every time
+PRODUCT_COUNT_TTL = int(os.getenv('PRODUCT_COUNT_TTL', 60))
+PRODUCT_PAGE_SIZE = 20
+# Caps both the page and the copy of it kept in catalog_cache
+PRODUCT_MAX_PAGE_SIZE = 100
+
+def encode_cursor_token(data):
+    raw = json.dumps(data, separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor_token(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode()).decode())
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(data, dict):
+        raise ValueError('Invalid cursor')
+    return data
+
+def encode_product_cursor(sort_by, row):
+    """Opaque token holding the sort key and id of the last row on a page."""
+    column, _ = PRODUCT_SORTS[sort_by]
+    value = row[column]
+    if hasattr(value, 'strftime'):
+        value = value.strftime('%Y-%m-%d %H:%M:%S')
+    elif not isinstance(value, str):
+        value = str(value)
+    return encode_cursor_token({'s': sort_by, 'v': value, 'id': row['id']})
+
+def decode_product_cursor(token, sort_by):
+    """Returns (value, id) from a cursor token; raises ValueError if it is invalid."""
+    data = decode_cursor_token(token)
+    try:
+        value, last_id = data['v'], int(data['id'])
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if data.get('s') != sort_by:
+        raise ValueError('Cursor does not match sort order')
+    return value, last_id
+
+def count_products(cursor, where_sql, params):
+    def load():
+        cursor.execute(f"SELECT COUNT(*) AS cnt FROM products p JOIN categories c ON p.category_id = c.id {where_sql}", params)
+        return cursor.fetchone()['cnt']
+    return catalog_cache.get_or_load('product_count', (where_sql, tuple(params)), load, ttl=PRODUCT_COUNT_TTL)
+
 @app.route('/api/products', methods=['GET'])
+@catalog_conditional
 def get_products():
+    """
+    Offset mode (default): ?page=&limit= with total/pages in the response.
+    Cursor mode: pass ?cursor= (empty for the first page) and follow
+    pagination.nextCursor; add include_total=true to get the (cached) total.
+    """
     try:
+        cache_key = request_cache_key()
+        cached = catalog_cache.get('products', cache_key)
+        if cached is not MISSING:
+            return jsonify(cached), 200
+
         category = request.args.get('category')
         sort_by = request.args.get('sort', 'name')
-        page = int(request.args.get('page', 1))
-        limit = int(request.args.get('limit', 20))
+        page = max(int(request.args.get('page', 1)), 1)
+        limit = min(max(int(request.args.get('limit', PRODUCT_PAGE_SIZE)), 1), PRODUCT_MAX_PAGE_SIZE)
         search = request.args.get('search', '')
+        cursor_token = request.args.get('cursor')
+        include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
+
+        match_query = fulltext_query(search) if search else None
+        if 'sort' not in request.args and match_query:
+            sort_by = 'relevance'
+        if sort_by not in PRODUCT_SORTS or (sort_by == 'relevance' and not match_query):
+            # default 'name'
+            sort_by = 'name'
+        sort_column, sort_dir = PRODUCT_SORTS[sort_by]
+        if sort_by == 'relevance' and cursor_token is not None:
+            return jsonify({'error': 'Cursor pagination is not available for relevance sort'}), 400
 
         offset = (page - 1) * limit
 
-        # Base SQL
-        sql_base = """
-            SELECT p.id, p.name, p.price, p.description, p.image,
-                   p.is_active, p.created_at, p.rating, p.stock,
-                   c.name AS category_name
-            FROM products p
-            JOIN categories c ON p.category_id = c.id
-            WHERE p.is_active = TRUE
-        """
+        # Filters
+        where_sql = "WHERE p.is_active = TRUE"
         params = []
 
         if category:
-            sql_base += " AND c.name = %s"
+            where_sql += " AND c.name = %s"
             params.append(category.strip())
 
-        if search:
-            sql_base += " AND (p.name LIKE %s OR p.description LIKE %s)"
+        if match_query:
+            where_sql += " AND MATCH(p.name, p.description) AGAINST (%s IN BOOLEAN MODE)"
+            params.append(match_query)
+        elif search:
+            # Terms too short for the FULLTEXT index fall back to a substring match
+            where_sql += " AND (p.name LIKE %s OR p.description LIKE %s)"
             like_term = f"%{search}%"
             params.extend([like_term, like_term])
 
-        # Determine sorting
-        # Allowed sorts: name (alphabetical), price-low, price-high, rating, newest
-        if sort_by == 'price-low':
-            sql_base += " ORDER BY p.price ASC"
-        elif sort_by == 'price-high':
-            sql_base += " ORDER BY p.price DESC"
-        elif sort_by == 'rating':
-            sql_base += " ORDER BY p.rating DESC"
-        elif sort_by == 'newest':
-            sql_base += " ORDER BY p.created_at DESC"
+        # Keyset condition: rows strictly after the cursor in (sort column, id) order
+        page_sql = where_sql
+        page_params = params.copy()
+        if cursor_token:
+            try:
+                last_value, last_id = decode_product_cursor(cursor_token, sort_by)
+            except ValueError as e:
+                return jsonify({'error': str(e)}), 400
+            op = '>' if sort_dir == 'ASC' else '<'
+            page_sql += f" AND (p.{sort_column}, p.id) {op} (%s, %s)"
+            page_params.extend([last_value, last_id])
+
+        if sort_by == 'relevance':
+            order_sql = "ORDER BY MATCH(p.name, p.description) AGAINST (%s IN BOOLEAN MODE) DESC, p.id ASC"
+            page_params.append(match_query)
         else:
-            # default 'name'
-            sql_base += " ORDER BY p.name ASC"
+            order_sql = f"ORDER BY p.{sort_column} {sort_dir}, p.id {sort_dir}"
 
-        # For total count, wrap base query without ORDER BY, LIMIT
-        count_sql = f"SELECT COUNT(*) AS cnt FROM ({sql_base}) AS sub"
-        # Add pagination
-        sql_base += " LIMIT %s OFFSET %s"
-        params_for_data = params.copy() + [limit, offset]
+        sql = f"""
+            SELECT p.id, p.name, p.price, p.description, p.image,
+                   p.is_active, p.created_at, p.rating, p.stock,
+                   c.name AS category_name
+            FROM products p
+            JOIN categories c ON p.category_id = c.id
+            {page_sql}
+            {order_sql}
+        """
+
+        cursor_mode = cursor_token is not None
+        if cursor_mode:
+            # One extra row tells us whether there is a next page
+            sql += " LIMIT %s"
+            page_params.append(limit + 1)
+        else:
+            sql += " LIMIT %s OFFSET %s"
+            page_params.extend([limit, offset])
 
         conn = get_db()
         try:
             with conn.cursor() as cursor:
-                # Total count
-                cursor.execute(count_sql, params)
-                total = cursor.fetchone()['cnt']
+                total = None
+                if not cursor_mode or include_total:
+                    total = count_products(cursor, where_sql, params)
                 # Fetch page
-                cursor.execute(sql_base, params_for_data)
+                cursor.execute(sql, page_params)
                 rows = cursor.fetchall()
         finally:
             conn.close()
 
+        has_more = False
+        if cursor_mode and len(rows) > limit:
+            rows = rows[:limit]
+            has_more = True
+
         # Convert datetime to ISO strings
         safe_rows = []
         for row in rows:
@@ -407,31 +831,52 @@ def get_products():
                 'price': float(row['price']),
                 'description': row['description'],
                 'image': row['image'],
+                'images': image_urls(row['image']),
                 'isActive': bool(row['is_active']),
-                'createdAt': row['created_at'].strftime('%Y-%m-%dT%H:%M:%SZ') if isinstance(row['created_at'], datetime) else row['created_at'],
+                'createdAt': row['created_at'].strftime('%Y-%m-%dT%H:%M:%SZ') if hasattr(row['created_at'], 'strftime') else row['created_at'],
                 'rating': float(row['rating']),
                 'stock': row['stock'],
                 'category_name': row['category_name']
             }
             safe_rows.append(row_safe)
 
-        return jsonify({
-            'products': safe_rows,
-            'pagination': {
+        if cursor_mode:
+            pagination = {
+                'limit': limit,
+                'hasMore': has_more,
+                'nextCursor': encode_product_cursor(sort_by, rows[-1]) if has_more else None
+            }
+            if total is not None:
+                pagination['total'] = total
+        else:
+            pagination = {
                 'page': page,
                 'limit': limit,
                 'total': total,
                 'pages': (total + limit - 1) // limit
             }
-        }), 200
+
+        payload = {
+            'products': safe_rows,
+            'pagination': pagination
+        }
+        catalog_cache.set('products', cache_key, payload)
+        return jsonify(payload), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # 6. Get single product
 @app.route('/api/products/<int:product_id>', methods=['GET'])
+@catalog_conditional
 def get_product(product_id):
     try:
+        version = getattr(g, 'catalog_version', None)
+        cached = catalog_cache.get('product', product_id)
+        # Entries written under an older catalog version may predate another worker's write
+        if cached is not MISSING and cached[0] == version:
+            return jsonify({'product': cached[1]}), 200
+
         conn = get_db()
         try:
             with conn.cursor() as cursor:
@@ -457,12 +902,14 @@ def get_product(product_id):
             'price': float(row['price']),
             'description': row['description'],
             'image': row['image'],
+            'images': image_urls(row['image']),
             'isActive': bool(row['is_active']),
             'createdAt': row['created_at'].strftime('%Y-%m-%dT%H:%M:%SZ') if isinstance(row['created_at'], datetime) else row['created_at'],
             'rating': float(row['rating']),
             'stock': row['stock'],
             'category_name': row['category_name']
         }
+        catalog_cache.set('product', product_id, (version, product_data))
         return jsonify({'product': product_data}), 200
 
     except Exception as e:
@@ -541,7 +988,9 @@ def update_product(product_id):
             cursor.execute(sql, tuple(params))
             if cursor.rowcount == 0:
                 return jsonify({'error': 'Product not found'}), 404
+            bump_catalog_version(cursor)
             conn.commit()
+        invalidate_catalog(product_id)
         return jsonify({'message': 'Product updated', 'data': updates}), 200
     except Exception as e:
         conn.rollback()
@@ -561,7 +1010,9 @@ def delete_product(product_id):
             cursor.execute("UPDATE products SET is_active=FALSE WHERE id=%s", (product_id,))
             if cursor.rowcount == 0:
                 return jsonify({'error': 'Product not found'}), 404
+            bump_catalog_version(cursor)
             conn.commit()
+        invalidate_catalog(product_id)
         return jsonify({'message': 'Product deleted'}), 200
     except Exception as e:
         conn.rollback()
@@ -571,49 +1022,109 @@ def delete_product(product_id):
 
 
 # 7. Get categories (with their products)
+# Product fields that may be requested through ?fields=, mapped to their columns
+CATEGORY_PRODUCT_FIELDS = {
+    'id': 'p.id',
+    'name': 'p.name',
+    'price': 'p.price',
+    'description': 'p.description',
+    'image': 'p.image',
+    'isActive': 'p.is_active',
+    'createdAt': 'p.created_at',
+    'rating': 'p.rating',
+    'stock': 'p.stock'
+}
+
+def format_category_product(row, fields):
+    product = {}
+    for field in fields:
+        value = row['p_' + field]
+        if field in ('price', 'rating'):
+            value = float(value)
+        elif field == 'isActive':
+            value = bool(value)
+        elif field == 'createdAt' and hasattr(value, 'strftime'):
+            value = value.strftime('%Y-%m-%dT%H:%M:%SZ')
+        product[field] = value
+    return product
+
 @app.route('/api/categories', methods=['GET'])
+@catalog_conditional
 def get_categories():
+    """
+    Categories and their active products in one round trip.
+    Optional: ?limit=N products per category, ?fields=id,name,price to trim products.
+    """
     try:
+        cache_key = request_cache_key()
+        cached = catalog_cache.get('categories', cache_key)
+        if cached is not MISSING:
+            return jsonify({'categories': cached}), 200
+
+        limit = request.args.get('limit', type=int)
+        fields_arg = request.args.get('fields')
+        if fields_arg:
+            fields = [f.strip() for f in fields_arg.split(',') if f.strip()]
+            unknown = [f for f in fields if f not in CATEGORY_PRODUCT_FIELDS]
+            if unknown:
+                return jsonify({'error': f"Unknown fields: {', '.join(unknown)}"}), 400
+            if 'id' not in fields:
+                fields.insert(0, 'id')
+        else:
+            fields = list(CATEGORY_PRODUCT_FIELDS)
+
+        product_cols = ', '.join(f"{CATEGORY_PRODUCT_FIELDS[f]} AS p_{f}" for f in fields)
+        params = []
+        if limit is not None and limit > 0:
+            # Number products within each category so the limit is applied in SQL
+            product_source = """
+                (SELECT p.*, ROW_NUMBER() OVER (PARTITION BY p.category_id ORDER BY p.id) AS rn
+                 FROM products p WHERE p.is_active = TRUE) p
+                ON p.category_id = c.id AND p.rn <= %s
+            """
+            params.append(limit)
+        else:
+            product_source = "products p ON p.category_id = c.id AND p.is_active = TRUE"
+
+        sql = f"""
+            SELECT c.id AS c_id, c.name AS c_name, c.created_at AS c_created_at,
+                   c.is_active AS c_is_active, {product_cols}
+            FROM categories c
+            LEFT JOIN {product_source}
+            WHERE c.is_active = TRUE
+            ORDER BY c.name ASC, c.id ASC, p.id ASC
+        """
+
         conn = get_db()
         try:
             with conn.cursor() as cursor:
-                cursor.execute("SELECT id, name, created_at, is_active FROM categories WHERE is_active = TRUE ORDER BY name ASC")
-                cats = cursor.fetchall()
-
-            result = []
-            for cat in cats:
-                cat_id = cat['id']
-                with conn.cursor() as cursor2:
-                    cursor2.execute("""
-                        SELECT id, name, price, description, image, is_active, created_at, rating, stock
-                        FROM products
-                        WHERE category_id = %s AND is_active = TRUE
-                    """, (cat_id,))
-                    prods = cursor2.fetchall()
-                # Build product list
-                prod_list = []
-                for p in prods:
-                    prod_list.append({
-                        'id': p['id'],
-                        'name': p['name'],
-                        'price': float(p['price']),
-                        'description': p['description'],
-                        'image': p['image'],
-                        'isActive': bool(p['is_active']),
-                        'createdAt': p['created_at'].strftime('%Y-%m-%dT%H:%M:%SZ') if isinstance(p['created_at'], datetime) else p['created_at'],
-                        'rating': float(p['rating']),
-                        'stock': p['stock']
-                    })
-                result.append({
-                    'id': cat_id,
-                    'name': cat['name'],
-                    'createdAt': cat['created_at'].strftime('%Y-%m-%dT%H:%M:%SZ') if isinstance(cat['created_at'], datetime) else cat['created_at'],
-                    'isActive': bool(cat['is_active']),
-                    'products': prod_list
-                })
+                cursor.execute(sql, params)
+                rows = cursor.fetchall()
         finally:
             conn.close()
 
+        # Group the joined rows back into categories
+        result = []
+        by_id = {}
+        for row in rows:
+            cat_id = row['c_id']
+            cat = by_id.get(cat_id)
+            if cat is None:
+                created_at = row['c_created_at']
+                cat = {
+                    'id': cat_id,
+                    'name': row['c_name'],
+                    'createdAt': created_at.strftime('%Y-%m-%dT%H:%M:%SZ') if hasattr(created_at, 'strftime') else created_at,
+                    'isActive': bool(row['c_is_active']),
+                    'products': []
+                }
+                by_id[cat_id] = cat
+                result.append(cat)
+            # LEFT JOIN yields one all-NULL product row for empty categories
+            if row['p_id'] is not None:
+                cat['products'].append(format_category_product(row, fields))
+
+        catalog_cache.set('categories', cache_key, result)
         return jsonify({'categories': result}), 200
 
     except Exception as e:
@@ -727,6 +1238,34 @@ def get_analytics():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Connection pool stats (in use, idle, wait times)
+@app.route('/api/admin/db/pool', methods=['GET'])
+def get_db_pool_stats():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return jsonify({'pool': db_pool.stats()}), 200
+
+# Password hashing pool stats (admission rejections, timeouts)
+@app.route('/api/admin/auth/hashing', methods=['GET'])
+def get_password_hasher_stats():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return jsonify({'hasher': password_hasher.stats()}), 200
+
+# Group-commit order queue stats (batch sizes, backlog)
+@app.route('/api/admin/orders/queue', methods=['GET'])
+def get_order_queue_stats():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return jsonify({'mode': ORDER_INGEST_MODE, 'queue': order_queue.stats()}), 200
+
+# Catalog cache stats (hit/miss per namespace)
+@app.route('/api/admin/cache', methods=['GET'])
+def get_catalog_cache_stats():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    return jsonify({'cache': catalog_cache.stats()}), 200
+
 # 12. Initialize database with sample admin (similar to init_database())
 # You can call this manually in a script or a separate route (protected).
 @app.route('/api/admin/init', methods=['POST'])
@@ -857,63 +1396,213 @@ def add_favorite():
         return jsonify({'error': str(e)}), 500
 
 # 14. (Optional) Order creation endpoint
+
+class OrderRejected(Exception):
+    """An order that fails validation; carries the HTTP status to answer with."""
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def parse_product_id(value):
+    """Accepts an int or a string of digits (JSON clients send both); returns int or None."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value if value > 0 else None
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip()) or None
+    return None
+
+def parse_order_items(items):
+    """Returns {product_id: quantity} with int ids, merging repeated products."""
+    if not items or not isinstance(items, list):
+        raise OrderRejected('Items array is required')
+    quantities = {}
+    for it in items:
+        if not isinstance(it, dict):
+            raise OrderRejected('Invalid item format')
+        pid = parse_product_id(it.get('product_id'))
+        qty = it.get('quantity', 0)
+        if pid is None or isinstance(qty, bool) or not isinstance(qty, int) or qty <= 0:
+            raise OrderRejected('Invalid item format')
+        quantities[pid] = quantities.get(pid, 0) + qty
+    return quantities
+
+def place_order(cursor, user_id, quantities):
+    """
+    Writes one order inside the caller's transaction and returns (order_id, total).
+
+    The round trips don't grow with the cart: one locking read of every
+    product, one order insert, one batched item insert and one guarded
+    stock update. Raises OrderRejected; the caller decides what to roll back.
+    """
+    ids = list(quantities)
+    placeholders = ', '.join(['%s'] * len(ids))
+
+    # Row locks hold off concurrent checkouts of the same products until commit
+    cursor.execute(f"""
+        SELECT id, name, price, stock FROM products
+        WHERE id IN ({placeholders}) AND is_active=TRUE
+        ORDER BY id
+        FOR UPDATE
+    """, ids)
+    products = {row['id']: row for row in cursor.fetchall()}
+
+    total = 0.0
+    for pid in ids:
+        prod = products.get(pid)
+        if not prod:
+            raise OrderRejected(f'Product {pid} not found', 404)
+        if prod['stock'] < quantities[pid]:
+            raise OrderRejected(f'Insufficient stock for product {pid}')
+        total += float(prod['price']) * quantities[pid]
+
+    cursor.execute("""
+        INSERT INTO orders (user_id, total, created_at)
+        VALUES (%s, %s, UTC_TIMESTAMP())
+    """, (user_id, total))
+    order_id = cursor.lastrowid
+
+    # PyMySQL folds this into a single multi-row INSERT
+    cursor.executemany("""
+        INSERT INTO order_items (order_id, product_id, product_name, quantity, price)
+        VALUES (%s, %s, %s, %s, %s)
+    """, [(order_id, pid, products[pid]['name'], quantities[pid], products[pid]['price']) for pid in ids])
+
+    # Decrement relative to the stored value, never below zero
+    qty_case = 'CASE id ' + ' '.join(['WHEN %s THEN %s'] * len(ids)) + ' END'
+    case_params = [v for pid in ids for v in (pid, quantities[pid])]
+    cursor.execute(f"""
+        UPDATE products SET stock = stock - {qty_case}
+        WHERE id IN ({placeholders}) AND stock >= {qty_case}
+    """, case_params + ids + case_params)
+    if cursor.rowcount != len(ids):
+        raise OrderRejected('Stock changed during checkout, please retry', 409)
+
+    return order_id, total
+
+# Group-commit ingestion (ORDER_INGEST_MODE=queue): requests only validate and
+# enqueue; a writer thread places queued orders in batches, one commit per batch.
+# Accepting an order writes nothing: the client gets a reference signed with
+# the issue time, and the batch records the outcome in order_intake. Any worker
+# can then answer a status check - an outcome row, or 'queued' while a validly
+# signed reference is younger than ORDER_REFERENCE_TTL.
+ORDER_INGEST_MODE = os.getenv('ORDER_INGEST_MODE', 'direct')
+ORDER_REFERENCE_TTL = int(os.getenv('ORDER_REFERENCE_TTL', 300))
+
+def ensure_order_intake(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS order_intake (
+                reference CHAR(32) PRIMARY KEY,
+                user_id VARCHAR(64) NOT NULL,
+                status VARCHAR(16) NOT NULL,
+                order_id INT NULL,
+                error VARCHAR(255) NULL,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+    conn.commit()
+
+def sign_order_reference(reference, user_id, issued=None):
+    """Client-facing reference: '<queue reference>.<issued unix time>.<HMAC>'."""
+    issued = int(time.time()) if issued is None else issued
+    message = f'{reference}.{issued}.{user_id}'.encode()
+    mac = hmac.new(app.config['SECRET_KEY'].encode(), message, hashlib.sha256).hexdigest()[:32]
+    return f'{reference}.{issued}.{mac}'
+
+def parse_order_reference(token, user_id):
+    """(queue reference, issued) for a reference signed for this user, else None."""
+    parts = token.split('.')
+    if len(parts) != 3 or not re.fullmatch(r'[0-9a-f]{32}', parts[0]) or not parts[1].isdigit():
+        return None
+    reference, issued = parts[0], int(parts[1])
+    if not hmac.compare_digest(sign_order_reference(reference, user_id, issued), token):
+        return None
+    return reference, issued
+
+def commit_order_batch(batch):
+    """GroupCommitQueue handler: every order in the batch shares one transaction."""
+    results = {}
+    intake_rows = []
+    conn = get_db()
+    try:
+        with conn.cursor() as cursor:
+            for reference, job in batch:
+                # A rejected order only undoes its own writes
+                cursor.execute("SAVEPOINT order_job")
+                try:
+                    order_id, total = place_order(cursor, job['user_id'], job['quantities'])
+                    results[reference] = {'status': 'committed', 'order_id': order_id, 'total': total}
+                    intake_rows.append((reference, job['user_id'], 'committed', order_id, None))
+                except OrderRejected as e:
+                    cursor.execute("ROLLBACK TO SAVEPOINT order_job")
+                    results[reference] = {'status': 'rejected', 'error': str(e)}
+                    intake_rows.append((reference, job['user_id'], 'rejected', None, str(e)[:255]))
+            cursor.executemany("""
+                INSERT INTO order_intake (reference, user_id, status, order_id, error)
+                VALUES (%s, %s, %s, %s, %s)
+                ON DUPLICATE KEY UPDATE status=VALUES(status), order_id=VALUES(order_id), error=VALUES(error)
+            """, intake_rows)
+            conn.commit()
+    except Exception as e:
+        conn.rollback()
+        # Let other workers report the failure instead of 'queued'
+        with conn.cursor() as cursor:
+            cursor.executemany("""
+                INSERT INTO order_intake (reference, user_id, status, error)
+                VALUES (%s, %s, 'failed', %s)
+                ON DUPLICATE KEY UPDATE status='failed', error=VALUES(error)
+            """, [(reference, job['user_id'], str(e)[:255]) for reference, job in batch])
+        conn.commit()
+        raise
+    finally:
+        conn.close()
+    return results
+
+order_queue = GroupCommitQueue(
+    commit_order_batch,
+    max_batch=int(os.getenv('ORDER_QUEUE_MAX_BATCH', 50)),
+    max_wait=float(os.getenv('ORDER_QUEUE_MAX_WAIT_MS', 20)) / 1000,
+    max_pending=int(os.getenv('ORDER_QUEUE_MAX_PENDING', 1000))
+)
+
 @app.route('/api/orders', methods=['POST'])
 @jwt_required()
 def create_order():
     """
     Expects JSON: { "items": [ { "product_id": int, "quantity": int }, ... ] }
     Calculates total, inserts into orders/order_items.
+    In queue mode answers 202 with a reference for GET /api/orders/intake/<reference>.
     """
     try:
         user_id = get_jwt_identity()
         data = request.get_json()
-        items = data.get('items')
-        if not items or not isinstance(items, list):
-            return jsonify({'error': 'Items array is required'}), 400
+        try:
+            quantities = parse_order_items(data.get('items'))
+        except OrderRejected as e:
+            return jsonify({'error': str(e)}), e.status
+
+        if ORDER_INGEST_MODE == 'queue':
+            try:
+                reference = order_queue.submit({'user_id': user_id, 'quantities': quantities})
+            except QueueFull as e:
+                resp = jsonify({'error': str(e)})
+                resp.headers['Retry-After'] = '1'
+                return resp, 503
+            return jsonify({
+                'message': 'Order queued',
+                'reference': sign_order_reference(reference, user_id),
+                'status': 'queued'
+            }), 202
 
         conn = get_db()
         try:
-            total = 0.0
-            # First, fetch prices and check stock (if needed)
             with conn.cursor() as cursor:
-                for it in items:
-                    pid = it.get('product_id')
-                    qty = it.get('quantity', 0)
-                    if pid is None or qty <= 0:
-                        return jsonify({'error': 'Invalid item format'}), 400
-                    cursor.execute("SELECT price, stock FROM products WHERE id=%s AND is_active=TRUE", (pid,))
-                    prod = cursor.fetchone()
-                    if not prod:
-                        return jsonify({'error': f'Product {pid} not found'}), 404
-                    price = float(prod['price'])
-                    stock = prod['stock']
-                    if stock < qty:
-                        return jsonify({'error': f'Insufficient stock for product {pid}'}), 400
-                    total += price * qty
-                # Insert into orders
-                now = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
-                cursor.execute("""
-                    INSERT INTO orders (user_id, total, created_at)
-                    VALUES (%s, %s, %s)
-                """, (user_id, total, now))
-                order_id = cursor.lastrowid
-                # Insert items, deduct stock
-                for it in items:
-                    pid = it['product_id']
-                    qty = it['quantity']
-                    cursor.execute("SELECT price, stock FROM products WHERE id=%s", (pid,))
-                    prod = cursor.fetchone()
-                    price = float(prod['price'])
-                    # Insert order_item
-                    cursor.execute("""
-                        INSERT INTO order_items (order_id, product_id, quantity, price)
-                        VALUES (%s, %s, %s, %s)
-                    """, (order_id, pid, qty, price))
-                    # Deduct stock
-                    new_stock = prod['stock'] - qty
-                    cursor.execute("UPDATE products SET stock=%s WHERE id=%s", (new_stock, pid))
+                order_id, total = place_order(cursor, user_id, quantities)
                 conn.commit()
-
+        except OrderRejected as e:
+            return jsonify({'error': str(e)}), e.status
         finally:
             conn.close()
 
@@ -922,124 +1611,522 @@ def create_order():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/orders/intake/<token>', methods=['GET'])
+@jwt_required()
+def get_order_intake(token):
+    try:
+        user_id = get_jwt_identity()
+        parsed = parse_order_reference(token, user_id)
+        if parsed is None:
+            return jsonify({'error': 'Unknown order reference'}), 404
+        reference, issued = parsed
+
+        local = order_queue.status(reference)
+        if local is not None and local['status'] == 'queued':
+            return jsonify({'reference': token, **local}), 200
+
+        conn = get_db()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT status, order_id, error FROM order_intake
+                    WHERE reference=%s AND user_id=%s
+                """, (reference, user_id))
+                row = cursor.fetchone()
+        finally:
+            conn.close()
+
+        if row:
+            return jsonify({'reference': token, **row}), 200
+        if local is not None:
+            # The outcome never reached order_intake
+            return jsonify({'reference': token, **local}), 200
+        if time.time() - issued < ORDER_REFERENCE_TTL:
+            # Still waiting in the queue of the worker that accepted it
+            return jsonify({'reference': token, 'status': 'queued'}), 200
+        return jsonify({'reference': token, 'status': 'failed',
+                        'error': 'Order was not processed, please place it again'}), 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # 15. (Optional) Get user orders
+ORDER_HISTORY_PAGE_SIZE = 20
+ORDER_HISTORY_MAX_PAGE_SIZE = 100
+
+def ensure_order_history_schema(conn):
+    """order_items.product_name snapshot plus the index behind the history query."""
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'order_items'
+              AND column_name = 'product_name'
+            LIMIT 1
+        """)
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE order_items ADD COLUMN product_name VARCHAR(255) NULL")
+        # Older rows get the product's current name; new rows store it at checkout
+        cursor.execute("""
+            UPDATE order_items oi JOIN products p ON oi.product_id = p.id
+            SET oi.product_name = p.name
+            WHERE oi.product_name IS NULL
+        """)
+        cursor.execute("""
+            SELECT 1 FROM information_schema.statistics
+            WHERE table_schema = DATABASE() AND table_name = 'orders'
+              AND index_name = 'idx_orders_user_created'
+            LIMIT 1
+        """)
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE orders ADD INDEX idx_orders_user_created (user_id, created_at, id)")
+    conn.commit()
+
+def parse_history_day(value, name):
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a date in YYYY-MM-DD format')
+
 @app.route('/api/orders', methods=['GET'])
 @jwt_required()
 def list_orders():
+    """
+    Newest first. Query params: limit (max 100), from / to (YYYY-MM-DD,
+    inclusive), cursor (pagination.nextCursor from the previous page).
+    One query returns the page of orders together with their items.
+    """
     try:
         user_id = get_jwt_identity()
+        try:
+            limit = min(max(int(request.args.get('limit', ORDER_HISTORY_PAGE_SIZE)), 1), ORDER_HISTORY_MAX_PAGE_SIZE)
+            conditions = ['user_id = %s']
+            params = [user_id]
+            if request.args.get('from'):
+                conditions.append('created_at >= %s')
+                params.append(parse_history_day(request.args['from'], 'from'))
+            if request.args.get('to'):
+                conditions.append('created_at < %s')
+                params.append(parse_history_day(request.args['to'], 'to') + timedelta(days=1))
+            if request.args.get('cursor'):
+                data = decode_cursor_token(request.args['cursor'])
+                try:
+                    last_created, last_id = data['v'], int(data['id'])
+                except (KeyError, TypeError, ValueError):
+                    raise ValueError('Invalid cursor')
+                conditions.append('(created_at < %s OR (created_at = %s AND id < %s))')
+                params.extend([last_created, last_created, last_id])
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
         conn = get_db()
-        orders_list = []
         try:
             with conn.cursor() as cursor:
-                cursor.execute("SELECT id, total, created_at FROM orders WHERE user_id=%s ORDER BY created_at DESC", (user_id,))
-                orders = cursor.fetchall()
-                for o in orders:
-                    # Fetch items
-                    cursor.execute("""
-                        SELECT oi.product_id, oi.quantity, oi.price, p.name
-                        FROM order_items oi
-                        JOIN products p ON oi.product_id = p.id
-                        WHERE oi.order_id=%s
-                    """, (o['id'],))
-                    items = cursor.fetchall()
-                    items_safe = []
-                    for it in items:
-                        items_safe.append({
-                            'product_id': it['product_id'],
-                            'name': it['name'],
-                            'quantity': it['quantity'],
-                            'price': float(it['price'])
-                        })
-                    orders_list.append({
-                        'order_id': o['id'],
-                        'total': float(o['total']),
-                        'createdAt': o['created_at'].strftime('%Y-%m-%dT%H:%M:%SZ') if isinstance(o['created_at'], datetime) else o['created_at'],
-                        'items': items_safe
-                    })
+                # The derived table picks the page (limit + 1 to detect more) off
+                # idx_orders_user_created; the join adds items in the same round trip
+                cursor.execute(f"""
+                    SELECT o.id, o.total, o.created_at,
+                           oi.product_id, oi.quantity, oi.price, oi.product_name
+                    FROM (
+                        SELECT id, total, created_at FROM orders
+                        WHERE {' AND '.join(conditions)}
+                        ORDER BY created_at DESC, id DESC
+                        LIMIT %s
+                    ) o
+                    LEFT JOIN order_items oi ON oi.order_id = o.id
+                    ORDER BY o.created_at DESC, o.id DESC, oi.id
+                """, params + [limit + 1])
+                rows = cursor.fetchall()
         finally:
             conn.close()
 
-        return jsonify({'orders': orders_list}), 200
+        orders_list = []
+        for row in rows:
+            if not orders_list or orders_list[-1]['order_id'] != row['id']:
+                created = row['created_at']
+                orders_list.append({
+                    'order_id': row['id'],
+                    'total': float(row['total']),
+                    'createdAt': created.strftime('%Y-%m-%dT%H:%M:%SZ') if hasattr(created, 'strftime') else created,
+                    'items': [],
+                    '_created': created
+                })
+            if row['product_id'] is not None:
+                orders_list[-1]['items'].append({
+                    'product_id': row['product_id'],
+                    'name': row['product_name'],
+                    'quantity': row['quantity'],
+                    'price': float(row['price'])
+                })
+
+        has_more = len(orders_list) > limit
+        orders_list = orders_list[:limit]
+        next_cursor = None
+        if has_more:
+            last = orders_list[-1]
+            created = last['_created']
+            next_cursor = encode_cursor_token({
+                'v': created.strftime('%Y-%m-%d %H:%M:%S') if hasattr(created, 'strftime') else str(created),
+                'id': last['order_id']
+            })
+        for order in orders_list:
+            del order['_created']
+
+        return jsonify({
+            'orders': orders_list,
+            'pagination': {'limit': limit, 'hasMore': has_more, 'nextCursor': next_cursor}
+        }), 200
 
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Mpesa Payment Route
-import requests # Handles HTTP requests
-import datetime # Works with date and time
-import base64 # Encoding data in Base64 format (used for authentication)
-from requests.auth import HTTPBasicAuth # Handles Basic authentication
+# One client per process: the OAuth token is cached and the HTTPS connections to
+# Daraja are kept alive between payments. Point MPESA_BASE_URL at mpesa_stub.py
+# to test locally.
+mpesa_client = MpesaClient(
+    base_url=os.getenv('MPESA_BASE_URL', "https://sandbox.safaricom.co.ke"),
+    consumer_key=os.getenv('MPESA_CONSUMER_KEY', "GTWADFxIpUfDoNikNGqq1C3023evM6UH"),
+    consumer_secret=os.getenv('MPESA_CONSUMER_SECRET', "amFbAoUByPV2rM5A"),
+    short_code=os.getenv('MPESA_SHORT_CODE', "174379"),  # Test Paybill (Safaricom Provided)
+    passkey=os.getenv('MPESA_PASSKEY', "bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919"),
+    callback_url=os.getenv('MPESA_CALLBACK_URL'),
+    timeout=(float(os.getenv('MPESA_CONNECT_TIMEOUT', 3.05)), float(os.getenv('MPESA_READ_TIMEOUT', 15))),
+    pool_size=int(os.getenv('MPESA_POOL_SIZE', 10))
+)
+
+# Payments are recorded as pending and the STK push runs on mpesa_workers, so
+# web workers never wait on Safaricom. Daraja reports the outcome to
+# /api/mpesa/callback; clients poll /api/payments/<reference>.
+# Set MPESA_CALLBACK_TOKEN in production: without it every callback costs an
+# STK push query, because the callback body alone can't be trusted.
+# pending -> sent (prompt delivered) -> paid | failed
+MPESA_CALLBACK_TOKEN = os.getenv('MPESA_CALLBACK_TOKEN', '')
+MPESA_MAX_BACKLOG = int(os.getenv('MPESA_MAX_BACKLOG', 100))
+mpesa_workers = ThreadPoolExecutor(
+    max_workers=int(os.getenv('MPESA_WORKERS', 4)),
+    thread_name_prefix='mpesa'
+)
+_mpesa_backlog = 0
+_mpesa_backlog_lock = threading.Lock()
+
+def mpesa_failure(e):
+    # Timeouts, connection errors, 5xx and throttling count against Daraja;
+    # a 4xx caused by the request itself does not
+    return not isinstance(e, MpesaError) or e.status is None or e.status >= 500 or e.status == 429
+
+# Once most recent pushes fail, stop calling Daraja for a while and fail fast;
+# after MPESA_BREAKER_OPEN_S one probe push decides whether to resume
+mpesa_breaker = CircuitBreaker(
+    'M-Pesa',
+    failure_rate=float(os.getenv('MPESA_BREAKER_FAILURE_RATE', 0.5)),
+    min_calls=int(os.getenv('MPESA_BREAKER_MIN_CALLS', 5)),
+    window=int(os.getenv('MPESA_BREAKER_WINDOW_S', 60)),
+    open_timeout=int(os.getenv('MPESA_BREAKER_OPEN_S', 30)),
+    is_failure=mpesa_failure
+)
+
+def payment_unavailable(message, retry_after):
+    resp = jsonify({'error': message, 'retryAfter': retry_after})
+    resp.headers['Retry-After'] = str(retry_after)
+    return resp, 503
+
+def ensure_payments(conn):
+    with conn.cursor() as cursor:
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS payments (
+                id BIGINT AUTO_INCREMENT PRIMARY KEY,
+                reference CHAR(32) NOT NULL UNIQUE,
+                order_id INT NULL,
+                phone VARCHAR(20) NOT NULL,
+                amount INT NOT NULL,
+                status VARCHAR(16) NOT NULL DEFAULT 'pending',
+                checkout_request_id VARCHAR(64) NULL UNIQUE,
+                mpesa_receipt VARCHAR(32) NULL,
+                result_code INT NULL,
+                result_desc VARCHAR(255) NULL,
+                created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+                INDEX idx_payments_order (order_id)
+            )
+        """)
+        cursor.execute("""
+            SELECT 1 FROM information_schema.columns
+            WHERE table_schema = DATABASE() AND table_name = 'orders'
+              AND column_name = 'payment_status'
+            LIMIT 1
+        """)
+        if not cursor.fetchone():
+            cursor.execute("ALTER TABLE orders ADD COLUMN payment_status VARCHAR(16) NULL")
+    conn.commit()
+
+def run_stk_push(reference, callback_url):
+    """
+    mpesa_workers job: sends the prompt for one pending payment. No pooled
+    connection is held during the call to Daraja; the outcome is recorded on
+    a fresh checkout, and any error leaves the payment failed, never pending.
+    """
+    global _mpesa_backlog
+    try:
+        conn = get_db()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT order_id, phone, amount FROM payments WHERE reference=%s AND status='pending'",
+                               (reference,))
+                payment = cursor.fetchone()
+        finally:
+            conn.close()
+        if not payment:
+            return
+
+        account = f"Order {payment['order_id']}" if payment['order_id'] else "SokoGarden Online"
+        try:
+            result = mpesa_breaker.call(mpesa_client.stk_push, payment['amount'], payment['phone'],
+                                        account, "Payments for Products", callback_url=callback_url)
+            if not result.get('CheckoutRequestID'):
+                raise MpesaError('STK push reply has no CheckoutRequestID')
+            update = ("UPDATE payments SET status='sent', checkout_request_id=%s, result_desc=%s "
+                      "WHERE reference=%s AND status='pending'",
+                      (result['CheckoutRequestID'], (result.get('CustomerMessage') or '')[:255], reference))
+        except Exception as e:
+            app.logger.warning('STK push failed for %s: %s', reference, e)
+            update = ("UPDATE payments SET status='failed', result_desc=%s WHERE reference=%s AND status='pending'",
+                      (str(e)[:255], reference))
+
+        conn = get_db()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(*update)
+            conn.commit()
+        finally:
+            conn.close()
+    except Exception:
+        app.logger.exception('Payment worker crashed for %s', reference)
+    finally:
+        with _mpesa_backlog_lock:
+            _mpesa_backlog -= 1
 
 @app.route('/api/mpesa_payment', methods=['POST'])
 def mpesa_payment():
-    if request.method == 'POST':
-        # Extract POST Values sent by the user
-        amount = request.form['amount'] # Payment amount
-        phone = request.form['phone'] # Customer's phone number
-
-        # Provide consumer_key and consumer_secret provided by safaricom
-        consumer_key = "GTWADFxIpUfDoNikNGqq1C3023evM6UH"# Your API Consumer Key
-        consumer_secret = "amFbAoUByPV2rM5A"# Your Api Consumer Secret
-
-        # Authenticate Yourself using above credentials to Safaricom Services, and Bearer Token this is used by safaricom for security identification purposes - Your are given Access
-        api_URL = "https://sandbox.safaricom.co.ke/oauth/v1/generate?grant_type=client_credentials"  # AUTH URL
-        # Provide your consumer_key and consumer_secret
-        response = requests.get(api_URL, auth=HTTPBasicAuth(consumer_key, consumer_secret))
-        # Get response as Dictionary
-        data = response.json()
-        # Retrieve the Provide Token
-        # Token allows you to proceed with the transaction
-        access_token = "Bearer" + ' ' + data['access_token']
-
-        #  GETTING THE PASSWORD
-        timestamp = datetime.datetime.today().strftime('%Y%m%d%H%M%S')  # Current Time
-        passkey = 'bfb279f9aa9bdbcf158e97dd71a467cd2e0c893059b10f78e6b72ada1ed2c919'  # Passkey(Safaricom Provided)
-        business_short_code = "174379"  # Test Paybile (Safaricom Provided)
-        # Combine above 3 Strings to get data variable
-        data = business_short_code + passkey + timestamp
-
-        # Why Convert Back to a String?
-        # The base64.b64encode() function returns a byte string
-        # Safaricom's API expects the password as normal string, not bytes
-        # So, we decode it back to UTF-8 string using .decode()
-        #UTF-8 (Unicode Transformation Format - 8 bit) is a character encoding system
-        # Encode to Base64
-        encoded = base64.b64encode(data.encode())
-        password = encoded.decode()
-
-        # BODY OR PAYLOAD Prepare the STK push Payload(Request Body)
-        payload = {
-            "BusinessShortCode": "174379",# The Paybill number
-            "Password":password,# Generated Password
-            "Timestamp": timestamp,# Current timedtamp
-            "TransactionType": "CustomerPayBillOnline", # Payment type
-            "Amount": amount,  # use 1 when testing
-            "PartyA": phone,  # change to your number
-            "PartyB": "174379",# Business Paybill Number
-            "PhoneNumber": phone,# Customer's phone number (Must be in 254 format)
-            "CallBackURL": "https://coding.co.ke/api/confirm.php",#  Where your information goes
-            "AccountReference": "SokoGarden Online", # Business Reference
-            "TransactionDesc": "Payments for Products" # Description of payment
-        }
+    """
+    Form or JSON: phone (254 format), and amount or order_id (the order's
+    total is charged). Answers 202 straight away with a reference to poll.
+    """
+    global _mpesa_backlog
+    data = request.get_json(silent=True) or request.form
+    phone = str(data.get('phone') or '').strip()
+    order_id = data.get('order_id')
+    if not re.fullmatch(r'254\d{9}', phone):
+        return jsonify({'error': 'phone must be in 2547XXXXXXXX format'}), 400
+
+    # Fail fast rather than queue payments that cannot go out soon
+    retry_after = mpesa_breaker.retry_after()
+    if retry_after:
+        return payment_unavailable('M-Pesa is temporarily unavailable, please try again shortly', retry_after)
+    if _mpesa_backlog >= MPESA_MAX_BACKLOG:
+        return payment_unavailable('Too many payments in progress, please try again shortly', 5)
 
-        # POPULAING THE HTTP HEADER, PROVIDE THE TOKEN ISSUED EARLIER
-        headers = {
-            "Authorization": access_token,# Include the access token
-            "Content-Type": "application/json" # set the content in json format
-        }
+    try:
+        conn = get_db()
+        try:
+            with conn.cursor() as cursor:
+                if order_id:
+                    cursor.execute("SELECT total FROM orders WHERE id=%s", (order_id,))
+                    order = cursor.fetchone()
+                    if not order:
+                        return jsonify({'error': 'Order not found'}), 404
+                    amount = float(order['total'])
+                else:
+                    try:
+                        amount = float(data.get('amount'))
+                    except (TypeError, ValueError):
+                        amount = 0
+                if amount <= 0:
+                    return jsonify({'error': 'amount must be a positive number'}), 400
+                # M-Pesa only takes whole shillings
+                amount = math.ceil(amount)
+
+                reference = uuid.uuid4().hex
+                cursor.execute("""
+                    INSERT INTO payments (reference, order_id, phone, amount)
+                    VALUES (%s, %s, %s, %s)
+                """, (reference, order_id or None, phone, amount))
+                conn.commit()
+        finally:
+            conn.close()
+
+        callback_url = mpesa_client.callback_url or url_for('mpesa_callback', _external=True)
+        if MPESA_CALLBACK_TOKEN:
+            callback_url += ('&' if '?' in callback_url else '?') + 'token=' + MPESA_CALLBACK_TOKEN
+        with _mpesa_backlog_lock:
+            _mpesa_backlog += 1
+        mpesa_workers.submit(run_stk_push, reference, callback_url)
+
+        return jsonify({
+            "message": "An MPESA Prompt is being sent to Your Phone, Please Check & Complete Payment",
+            "reference": reference,
+            "status": "pending",
+            "statusUrl": url_for('get_payment_status', reference=reference)
+        }), 202
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def confirm_stk_result(checkout_id):
+    """Daraja's own (result_code, result_desc) for a checkout, via STK push query."""
+    result = mpesa_breaker.call(mpesa_client.stk_query, checkout_id)
+    try:
+        return int(result['ResultCode']), result.get('ResultDesc')
+    except (KeyError, TypeError, ValueError):
+        raise MpesaError('STK query reply has no usable ResultCode')
+
+@app.route('/api/mpesa/callback', methods=['POST'])
+def mpesa_callback():
+    """
+    Daraja STK callback: settles the payment and, when paid, its order.
+    With MPESA_CALLBACK_TOKEN set, the token in the callback URL authenticates
+    the request. Without it anyone could post here, so the outcome is taken
+    from an STK push query to Daraja instead of from the request body.
+    """
+    if MPESA_CALLBACK_TOKEN and not hmac.compare_digest(request.args.get('token', ''), MPESA_CALLBACK_TOKEN):
+        return jsonify({'ResultCode': 1, 'ResultDesc': 'Rejected'}), 403
+
+    try:
+        callback = ((request.get_json(silent=True) or {}).get('Body') or {}).get('stkCallback') or {}
+        checkout_id = callback.get('CheckoutRequestID')
+        result_code = int(callback.get('ResultCode'))
+        meta = {item.get('Name'): item.get('Value')
+                for item in (callback.get('CallbackMetadata') or {}).get('Item', [])}
+        amount_paid = int(float(meta.get('Amount', 0)))
+    except (AttributeError, TypeError, ValueError):
+        return jsonify({'ResultCode': 1, 'ResultDesc': 'Malformed callback'}), 400
+    if not checkout_id or not isinstance(checkout_id, str):
+        return jsonify({'ResultCode': 1, 'ResultDesc': 'Malformed callback'}), 400
+    result_desc = callback.get('ResultDesc')
+
+    try:
+        if not MPESA_CALLBACK_TOKEN:
+            # Only spend a query on checkouts we are actually waiting for
+            conn = get_db()
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute("""
+                        SELECT 1 FROM payments
+                        WHERE checkout_request_id=%s AND status IN ('pending', 'sent')
+                    """, (checkout_id,))
+                    waiting = cursor.fetchone() is not None
+            finally:
+                conn.close()
+            if not waiting:
+                app.logger.warning('Callback for unknown or settled checkout %s', checkout_id)
+                return jsonify({'ResultCode': 0, 'ResultDesc': 'Accepted'}), 200
+            try:
+                result_code, result_desc = confirm_stk_result(checkout_id)
+            except (MpesaError, CircuitOpen) as e:
+                app.logger.warning('Could not confirm M-Pesa callback %s: %s', checkout_id, e)
+                return jsonify({'ResultCode': 1, 'ResultDesc': 'Could not confirm payment'}), 503
+
+        conn = get_db()
+        try:
+            with conn.cursor() as cursor:
+                # Only an unsettled payment changes, so Daraja's retries are harmless
+                cursor.execute("""
+                    SELECT id, order_id, amount FROM payments
+                    WHERE checkout_request_id=%s AND status IN ('pending', 'sent')
+                    FOR UPDATE
+                """, (checkout_id,))
+                payment = cursor.fetchone()
+                if not payment:
+                    app.logger.warning('Callback for unknown or settled checkout %s', checkout_id)
+                    return jsonify({'ResultCode': 0, 'ResultDesc': 'Accepted'}), 200
+
+                # A confirmed query is authoritative for the amount we pushed
+                paid = result_code == 0 and (not MPESA_CALLBACK_TOKEN or amount_paid >= payment['amount'])
+                if result_code == 0 and not paid:
+                    result_desc = 'Amount paid is less than amount due'
+                cursor.execute("""
+                    UPDATE payments SET status=%s, result_code=%s, result_desc=%s, mpesa_receipt=%s
+                    WHERE id=%s
+                """, ('paid' if paid else 'failed', result_code, str(result_desc or '')[:255],
+                      str(meta.get('MpesaReceiptNumber') or '')[:32] or None, payment['id']))
+                if paid and payment['order_id']:
+                    cursor.execute("UPDATE orders SET payment_status='paid' WHERE id=%s", (payment['order_id'],))
+                conn.commit()
+        finally:
+            conn.close()
+    except Exception as e:
+        app.logger.exception('Failed to record M-Pesa callback %s', checkout_id)
+        return jsonify({'ResultCode': 1, 'ResultDesc': str(e)}), 500
+
+    return jsonify({'ResultCode': 0, 'ResultDesc': 'Accepted'}), 200
+
+@app.route('/api/payments/<reference>', methods=['GET'])
+def get_payment_status(reference):
+    try:
+        conn = get_db()
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("""
+                    SELECT reference, order_id, amount, status, mpesa_receipt, result_desc, updated_at
+                    FROM payments WHERE reference=%s
+                """, (reference,))
+                payment = cursor.fetchone()
+        finally:
+            conn.close()
+        if not payment:
+            return jsonify({'error': 'Payment not found'}), 404
+
+        resp = jsonify({
+            'reference': payment['reference'],
+            'orderId': payment['order_id'],
+            'amount': payment['amount'],
+            'status': payment['status'],
+            'receipt': payment['mpesa_receipt'],
+            'message': payment['result_desc'],
+            'updatedAt': payment['updated_at'].strftime('%Y-%m-%dT%H:%M:%SZ') if payment['updated_at'] else None
+        })
+        resp.headers['Cache-Control'] = 'no-store'
+        return resp, 200
+
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# M-Pesa client and breaker stats (token refreshes, queued pushes, breaker state/trips)
+@app.route('/api/admin/mpesa', methods=['GET'])
+def get_mpesa_stats():
+    if 'admin_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    with _mpesa_backlog_lock:
+        backlog = _mpesa_backlog
+    return jsonify({
+        'mpesa': mpesa_client.stats(),
+        'breaker': mpesa_breaker.stats(),
+        'backlog': backlog
+    }), 200
+
+# Idempotent schema additions (indexes, helper tables) and backfills.
+# Run `flask --app app ensure-schema` as a deploy step before starting workers;
+# the dev server runs it on startup. Errors propagate so a failed step is visible.
+def ensure_schema():
+    conn = get_db()
+    try:
+        ensure_search_index(conn)
+        ensure_product_sort_indexes(conn)
+        ensure_catalog_version(conn)
+        ensure_order_intake(conn)
+        ensure_order_history_schema(conn)
+        ensure_payments(conn)
+    finally:
+        conn.close()
 
-        # Specify STK Push  Trigger URL
-        url = "https://sandbox.safaricom.co.ke/mpesa/stkpush/v1/processrequest"
-        # Create a POST Request to above url, providing headers, payload
-        # Below triggers an STK Push to the phone number indicated in the payload and the amount.
-        response = requests.post(url, json=payload, headers=headers)
-        print(response.text) # Print the response for debugging
-        # Give a JSON Response to the user
-        return jsonify({"message": "An MPESA Prompt has been sent to Your Phone, Please Check & Complete Payment"})
-        #  push meaning (SIM Toolkit) initiating payment process in your moblie app
+@app.cli.command('ensure-schema')
+def ensure_schema_command():
+    """Create the indexes and helper tables the API relies on."""
+    ensure_schema()
+    print('Schema ready')
 
 # 16. Run app
 if __name__ == '__main__':
     # For development; in production, use a WSGI server and proper environment variables
+    ensure_schema()
+    password_hasher.warm_up()
     app.run(debug=True)
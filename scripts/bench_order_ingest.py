@@ -0,0 +1,126 @@
+"""
+Compares per-request commits with GroupCommitQueue batching.
+
+Runs against a throwaway SQLite file with synchronous=FULL, so every commit
+pays an fsync; --commit-latency-ms adds a sleep after each commit to stand in
+for the network round trip to the remote MySQL server. The sleep happens once
+the write lock is released, so it does not serialise the direct-mode clients.
+
+    python bench_order_ingest.py --orders 2000 --clients 16 --commit-latency-ms 5
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+from order_queue import GroupCommitQueue
+
+
+def connect(path):
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=FULL')
+    return conn
+
+
+def setup(path):
+    conn = connect(path)
+    conn.execute('CREATE TABLE products (id INTEGER PRIMARY KEY, price REAL, stock INTEGER)')
+    conn.execute('CREATE TABLE orders (id INTEGER PRIMARY KEY, user_id TEXT, total REAL)')
+    conn.execute('CREATE TABLE order_items (order_id INTEGER, product_id INTEGER, quantity INTEGER, price REAL)')
+    conn.executemany('INSERT INTO products VALUES (?, ?, ?)', [(i, 2.5, 10 ** 9) for i in range(1, 21)])
+    conn.commit()
+    conn.close()
+
+
+def place(cursor, user_id, product_id):
+    cursor.execute('SELECT price FROM products WHERE id = ?', (product_id,))
+    price = cursor.fetchone()[0]
+    cursor.execute('INSERT INTO orders (user_id, total) VALUES (?, ?)', (user_id, price))
+    order_id = cursor.lastrowid
+    cursor.execute('INSERT INTO order_items VALUES (?, ?, 1, ?)', (order_id, product_id, price))
+    cursor.execute('UPDATE products SET stock = stock - 1 WHERE id = ? AND stock >= 1', (product_id,))
+    return order_id
+
+
+def run_clients(clients, orders, work):
+    per_client = orders // clients
+    threads = [threading.Thread(target=work, args=(c, per_client)) for c in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return per_client * clients, time.perf_counter() - started
+
+
+def bench_direct(path, clients, orders, latency):
+    # SQLite allows a single writer, much like row locks on hot products in MySQL
+    def work(client, count):
+        conn = connect(path)
+        for i in range(count):
+            place(conn.cursor(), f'user-{client}', i % 20 + 1)
+            conn.commit()
+            time.sleep(latency)
+        conn.close()
+
+    return run_clients(clients, orders, work)
+
+
+def bench_queue(path, clients, orders, latency, max_batch, max_wait):
+    conn = connect(path)
+
+    def handle_batch(batch):
+        cursor = conn.cursor()
+        results = {ref: {'status': 'committed', 'order_id': place(cursor, job['user_id'], job['product_id'])}
+                   for ref, job in batch}
+        conn.commit()
+        time.sleep(latency)
+        return results
+
+    order_queue = GroupCommitQueue(handle_batch, max_batch=max_batch, max_wait=max_wait,
+                                   max_pending=orders)
+
+    def work(client, count):
+        references = [order_queue.submit({'user_id': f'user-{client}', 'product_id': i % 20 + 1})
+                      for i in range(count)]
+        for ref in references:
+            while order_queue.status(ref)['status'] == 'queued':
+                time.sleep(0.001)
+
+    done, elapsed = run_clients(clients, orders, work)
+    return done, elapsed, order_queue.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--commit-latency-ms', type=float, default=5.0)
+    parser.add_argument('--max-batch', type=int, default=50)
+    parser.add_argument('--max-wait-ms', type=float, default=20.0)
+    args = parser.parse_args()
+    latency = args.commit_latency_ms / 1000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        direct_db = os.path.join(tmp, 'direct.db')
+        queue_db = os.path.join(tmp, 'queue.db')
+        setup(direct_db)
+        setup(queue_db)
+
+        done, elapsed = bench_direct(direct_db, args.clients, args.orders, latency)
+        direct_rate = done / elapsed
+        print(f'per-request commit: {done} orders in {elapsed:.2f}s = {direct_rate:.0f} orders/s')
+
+        done, elapsed, stats = bench_queue(queue_db, args.clients, args.orders, latency,
+                                           args.max_batch, args.max_wait_ms / 1000)
+        queue_rate = done / elapsed
+        print(f'group commit:       {done} orders in {elapsed:.2f}s = {queue_rate:.0f} orders/s '
+              f'({stats["batches"]} batches, avg {stats["avgBatchSize"]}, max {stats["maxBatchSize"]})')
+        print(f'speed-up: {queue_rate / direct_rate:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""
+Measures password verification throughput on request threads vs PasswordHasher.
+
+Each mode runs --clients threads doing --logins verifications in total, while
+a probe thread times a tiny piece of Python work every 10ms to show how much
+hashing slows down everything else in the process.
+
+    python bench_password_hash.py --logins 200 --clients 16 --workers 4
+"""
+import argparse
+import statistics
+import threading
+import time
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+from password_pool import HasherBusy, PasswordHasher
+
+
+def probe(stop, samples):
+    while not stop.is_set():
+        started = time.perf_counter()
+        sum(range(1000))
+        samples.append((time.perf_counter() - started) * 1000)
+        time.sleep(0.01)
+
+
+def run(verify, pwhash, clients, logins):
+    per_client = logins // clients
+    rejected = []
+    stop = threading.Event()
+    samples = []
+
+    def work():
+        for _ in range(per_client):
+            try:
+                verify(pwhash, 'correct horse battery staple')
+            except HasherBusy:
+                rejected.append(1)
+
+    prober = threading.Thread(target=probe, args=(stop, samples))
+    prober.start()
+    threads = [threading.Thread(target=work) for _ in range(clients)]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - started
+    stop.set()
+    prober.join()
+
+    done = per_client * clients - len(rejected)
+    p99 = statistics.quantiles(samples, n=100)[98] if len(samples) >= 2 else 0.0
+    return done, len(rejected), elapsed, p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--clients', type=int, default=16)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-pending', type=int, default=64)
+    args = parser.parse_args()
+
+    pwhash = generate_password_hash('correct horse battery staple')
+
+    done, rejected, elapsed, p99 = run(check_password_hash, pwhash, args.clients, args.logins)
+    print(f'request threads: {done / elapsed:.1f} verifications/s, probe p99 {p99:.2f}ms')
+
+    hasher = PasswordHasher(generate_password_hash, check_password_hash,
+                            workers=args.workers, max_pending=args.max_pending, admit_timeout=5)
+    hasher.warm_up()
+    done, rejected, elapsed, p99 = run(hasher.verify, pwhash, args.clients, args.logins)
+    print(f'process pool:    {done / elapsed:.1f} verifications/s, probe p99 {p99:.2f}ms, '
+          f'{rejected} rejected ({args.workers} workers)')
+
+
+if __name__ == '__main__':
+    main()
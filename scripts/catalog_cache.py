@@ -0,0 +1,130 @@
+import threading
+import time
+from collections import OrderedDict
+
+from flask import g, request
+
+from http_cache import CachedVersion, conditional_get
+
+MISSING = object()
+
+
+class CatalogCache:
+    """
+    In-process LRU cache with a TTL, split into namespaces
+    ('product', 'products', 'categories', ...).
+
+    invalidate(namespace, key) drops one entry; invalidate(namespace) bumps the
+    namespace generation so every existing entry in it stops matching and is
+    evicted by the LRU in due course.
+    """
+
+    def __init__(self, max_entries=1024, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (namespace, generation, key) -> (expires_at, value)
+        self._generations = {}
+        self._hits = {}
+        self._misses = {}
+        self._evictions = 0
+        self._invalidations = 0
+
+    def _full_key(self, namespace, key):
+        return (namespace, self._generations.get(namespace, 0), key)
+
+    def get(self, namespace, key):
+        now = time.monotonic()
+        with self._lock:
+            full_key = self._full_key(namespace, key)
+            entry = self._entries.get(full_key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(full_key)
+                self._hits[namespace] = self._hits.get(namespace, 0) + 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[full_key]
+            self._misses[namespace] = self._misses.get(namespace, 0) + 1
+            return MISSING
+
+    def set(self, namespace, key, value, ttl=None):
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            full_key = self._full_key(namespace, key)
+            self._entries[full_key] = (expires_at, value)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def get_or_load(self, namespace, key, loader, ttl=None):
+        value = self.get(namespace, key)
+        if value is MISSING:
+            value = loader()
+            self.set(namespace, key, value, ttl)
+        return value
+
+    def invalidate(self, namespace, key=MISSING):
+        with self._lock:
+            self._invalidations += 1
+            if key is MISSING:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            else:
+                self._entries.pop(self._full_key(namespace, key), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            namespaces = set(self._hits) | set(self._misses)
+            per_namespace = {}
+            for ns in sorted(namespaces):
+                hits = self._hits.get(ns, 0)
+                misses = self._misses.get(ns, 0)
+                per_namespace[ns] = {
+                    'hits': hits,
+                    'misses': misses,
+                    'hitRate': round(hits / (hits + misses), 4) if hits + misses else 0.0
+                }
+            return {
+                'entries': len(self._entries),
+                'maxEntries': self.max_entries,
+                'ttl': self.ttl,
+                'evictions': self._evictions,
+                'invalidations': self._invalidations,
+                'namespaces': per_namespace
+            }
+
+
+class Catalog:
+    """
+    The catalog cache of one app plus the catalog version that guards it.
+
+    load_version() is the app's own (version, last_modified) reader. The
+    version is read at most once per version_ttl seconds per worker and drives
+    the ETags of views decorated with conditional; invalidate() drops the
+    cached entries and the cached version after a local catalog write.
+    namespaces are the cache namespaces a catalog write makes stale.
+    """
+
+    def __init__(self, load_version, namespaces, max_entries=1024, ttl=300, version_ttl=2.0):
+        self.cache = CatalogCache(max_entries=max_entries, ttl=ttl)
+        self.version = CachedVersion(load_version, ttl=version_ttl)
+        # Answers If-None-Match / If-Modified-Since with 304 before the view runs
+        self.conditional = conditional_get(self.version, 'catalog')
+        self.namespaces = tuple(namespaces)
+
+    def invalidate(self, product_id=None):
+        if product_id is not None:
+            self.cache.invalidate('product', product_id)
+        for namespace in self.namespaces:
+            self.cache.invalidate(namespace)
+        self.version.invalidate()
+
+    @staticmethod
+    def request_key():
+        # Including the catalog version keeps workers from serving pages older than the DB
+        version = getattr(g, 'catalog_version', None)
+        return (version,) + tuple(sorted(request.args.items(multi=True)))
@@ -0,0 +1,144 @@
+import threading
+import time
+from collections import deque
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency the breaker has given up on."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'{name} is unavailable, retry in {retry_after}s')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for calls to a remote dependency.
+
+    failure_rate:    fraction of failed calls in the window that trips the breaker
+    min_calls:       calls needed in the window before the rate is trusted
+    window:          seconds of call history considered
+    open_timeout:    seconds to stay open before letting probe calls through
+    half_open_calls: probes allowed at once while half-open; one success
+                     closes the breaker, one failure opens it again
+    is_failure:      callable(exception) -> bool; exceptions it rejects
+                     (e.g. a 400 from bad input) pass through uncounted
+    """
+
+    def __init__(self, name, failure_rate=0.5, min_calls=10, window=60,
+                 open_timeout=30, half_open_calls=1, is_failure=None):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_timeout = open_timeout
+        self.half_open_calls = half_open_calls
+        self._is_failure = is_failure or (lambda e: True)
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._calls = deque()  # (finished_at, failed)
+        self._opened_at = 0.0
+        self._probes = 0
+
+        # Counters exposed through stats()
+        self._trips = 0
+        self._rejected = 0
+        self._successes = 0
+        self._failures = 0
+
+    def _trim(self, now):
+        while self._calls and self._calls[0][0] < now - self.window:
+            self._calls.popleft()
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.open_timeout:
+            self._state = HALF_OPEN
+            self._probes = 0
+        return self._state
+
+    def _trip(self, now):
+        self._state = OPEN
+        self._opened_at = now
+        self._calls.clear()
+        self._trips += 1
+
+    def retry_after(self):
+        """Whole seconds until calls may go through again; 0 when they may now."""
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == OPEN:
+                return max(int(self.open_timeout - (now - self._opened_at)) + 1, 1)
+            if state == HALF_OPEN and self._probes >= self.half_open_calls:
+                return 1
+            return 0
+
+    def _before_call(self):
+        with self._lock:
+            now = time.monotonic()
+            state = self._current_state(now)
+            if state == CLOSED:
+                return False
+            if state == HALF_OPEN and self._probes < self.half_open_calls:
+                self._probes += 1
+                return True
+            self._rejected += 1
+            retry_after = max(int(self.open_timeout - (now - self._opened_at)) + 1, 1) if state == OPEN else 1
+        raise CircuitOpen(self.name, retry_after)
+
+    def _after_call(self, probe, failed):
+        with self._lock:
+            now = time.monotonic()
+            if failed:
+                self._failures += 1
+            else:
+                self._successes += 1
+
+            if probe:
+                self._probes -= 1
+                if failed:
+                    self._trip(now)
+                elif self._state == HALF_OPEN:
+                    self._state = CLOSED
+                return
+
+            self._calls.append((now, failed))
+            self._trim(now)
+            if self._state == CLOSED and failed and len(self._calls) >= self.min_calls:
+                failures = sum(1 for _, f in self._calls if f)
+                if failures / len(self._calls) >= self.failure_rate:
+                    self._trip(now)
+
+    def call(self, func, *args, **kwargs):
+        probe = self._before_call()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            self._after_call(probe, self._is_failure(e))
+            raise
+        self._after_call(probe, False)
+        return result
+
+    def stats(self):
+        with self._lock:
+            now = time.monotonic()
+            self._trim(now)
+            state = self._current_state(now)
+            recent = len(self._calls)
+            recent_failures = sum(1 for _, f in self._calls if f)
+            return {
+                'name': self.name,
+                'state': state,
+                'trips': self._trips,
+                'rejected': self._rejected,
+                'successes': self._successes,
+                'failures': self._failures,
+                'windowCalls': recent,
+                'windowFailureRate': round(recent_failures / recent, 4) if recent else 0.0,
+                'openForS': round(now - self._opened_at, 1) if state != CLOSED else 0.0
+            }
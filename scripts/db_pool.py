@@ -0,0 +1,262 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out within the timeout."""
+
+
+class PoolClosed(Exception):
+    """Raised when a connection is requested after close_all()."""
+
+
+class PooledConnection:
+    """
+    Thin wrapper around a DB-API connection handed out by ConnectionPool.
+    Everything is delegated to the real connection, except close(),
+    which rolls back any unfinished transaction and returns it to the pool.
+    """
+
+    def __init__(self, pool, raw, created_at):
+        self._pool = pool
+        self._raw = raw
+        self._created_at = created_at
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pool._release(self._raw, self._created_at)
+
+
+class ConnectionPool:
+    """
+    Small thread-safe connection pool.
+
+    connect:        zero-arg callable that opens a new raw connection
+    min_size:       connections kept open while idle
+    max_size:       hard cap on open connections (idle + in use)
+    timeout:        seconds to wait for a free connection before PoolTimeout
+    recycle:        seconds after which a connection is closed and replaced
+    ping_on_borrow: run a cheap health check before handing a connection out
+    warm:           open min_size connections now; failures are logged, and
+                    the pool then opens connections lazily on demand
+    """
+
+    def __init__(self, connect, min_size=1, max_size=10, timeout=10.0,
+                 recycle=280, ping_on_borrow=True, warm=True):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError('Invalid pool size: min=%s max=%s' % (min_size, max_size))
+        self._connect = connect
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_on_borrow = ping_on_borrow
+
+        self._lock = threading.Condition()
+        self._idle = deque()  # (raw_conn, created_at)
+        self._in_use = 0
+        self._opening = 0
+        self._closed = False
+
+        # Counters exposed through stats()
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_time_total = 0.0
+        self._wait_time_max = 0.0
+        self._timeouts = 0
+        self._created = 0
+        self._recycled = 0
+        self._failed_pings = 0
+
+        if warm:
+            try:
+                self.warm_up()
+            except Exception as e:
+                logger.warning('Connection pool warm-up failed: %s', e)
+
+    # ------------- internal helpers -------------
+
+    def _total(self):
+        return len(self._idle) + self._in_use + self._opening
+
+    def _record_wait(self, started):
+        wait = time.monotonic() - started
+        self._waits += 1
+        self._wait_time_total += wait
+        self._wait_time_max = max(self._wait_time_max, wait)
+
+    def _open(self):
+        raw = self._connect()
+        with self._lock:
+            self._created += 1
+        return raw, time.monotonic()
+
+    def _discard(self, raw):
+        try:
+            raw.close()
+        except Exception:
+            pass
+
+    def _is_stale(self, created_at):
+        return self.recycle and time.monotonic() - created_at > self.recycle
+
+    def _healthy(self, raw):
+        if not self.ping_on_borrow:
+            return True
+        try:
+            raw.ping(reconnect=False)
+            return True
+        except Exception:
+            with self._lock:
+                self._failed_pings += 1
+            return False
+
+    # ------------- public API -------------
+
+    def acquire(self, timeout=None):
+        """Check out a connection, opening a new one if the pool has room."""
+        timeout = self.timeout if timeout is None else timeout
+        started = time.monotonic()
+        deadline = started + timeout
+        waited = False
+
+        with self._lock:
+            while True:
+                if self._closed:
+                    raise PoolClosed('Connection pool is closed')
+                if self._idle:
+                    raw, created_at = self._idle.pop()
+                    self._in_use += 1
+                    break
+                if self._total() < self.max_size:
+                    raw = None
+                    self._opening += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    if waited:
+                        self._record_wait(started)
+                    raise PoolTimeout('Timed out after %.1fs waiting for a database connection' % timeout)
+                waited = True
+                self._lock.wait(remaining)
+
+            self._checkouts += 1
+            if waited:
+                self._record_wait(started)
+
+        # Network work happens outside the lock
+        try:
+            if raw is None:
+                raw, created_at = self._open()
+                with self._lock:
+                    self._opening -= 1
+                    self._in_use += 1
+            elif self._is_stale(created_at) or not self._healthy(raw):
+                if self._is_stale(created_at):
+                    with self._lock:
+                        self._recycled += 1
+                self._discard(raw)
+                raw, created_at = self._open()
+        except Exception:
+            with self._lock:
+                if raw is None:
+                    self._opening -= 1
+                else:
+                    self._in_use -= 1
+                self._lock.notify()
+            raise
+
+        return PooledConnection(self, raw, created_at)
+
+    def _release(self, raw, created_at):
+        try:
+            # Never hand out a connection with a half-finished transaction
+            raw.rollback()
+            healthy = True
+        except Exception:
+            healthy = False
+
+        with self._lock:
+            self._in_use -= 1
+            if healthy and not self._closed and not self._is_stale(created_at):
+                self._idle.append((raw, created_at))
+                raw = None
+            elif healthy and not self._closed:
+                self._recycled += 1
+            self._lock.notify()
+
+        if raw is not None:
+            self._discard(raw)
+
+    def warm_up(self):
+        """Open connections until min_size are idle."""
+        while True:
+            with self._lock:
+                if (self._closed or len(self._idle) >= self.min_size
+                        or self._total() >= self.max_size):
+                    return
+                self._opening += 1
+            try:
+                raw, created_at = self._open()
+            except Exception:
+                with self._lock:
+                    self._opening -= 1
+                raise
+            with self._lock:
+                self._opening -= 1
+                if not self._closed:
+                    self._idle.append((raw, created_at))
+                    self._lock.notify()
+                    continue
+            self._discard(raw)
+            return
+
+    def close_all(self):
+        """
+        Close every idle connection and refuse further checkouts.
+        In-use connections are closed when they are released.
+        """
+        with self._lock:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._lock.notify_all()
+        for raw, _ in idle:
+            self._discard(raw)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'closed': self._closed,
+                'inUse': self._in_use,
+                'idle': len(self._idle),
+                'total': self._total(),
+                'minSize': self.min_size,
+                'maxSize': self.max_size,
+                'checkouts': self._checkouts,
+                'waits': self._waits,
+                'waitTimeTotalMs': round(self._wait_time_total * 1000, 2),
+                'waitTimeMaxMs': round(self._wait_time_max * 1000, 2),
+                'waitTimeAvgMs': round(self._wait_time_total * 1000 / self._waits, 2) if self._waits else 0.0,
+                'timeouts': self._timeouts,
+                'created': self._created,
+                'recycled': self._recycled,
+                'failedPings': self._failed_pings
+            }
@@ -0,0 +1,86 @@
+import hashlib
+import threading
+import time
+from functools import wraps
+
+from flask import Response, current_app, g, jsonify, make_response, request
+
+
+class CachedVersion:
+    """
+    Wraps load_version() so each worker reads it at most once per ttl seconds
+    instead of once per request. invalidate() after a local write makes this
+    worker re-read on its next request; other workers catch up within ttl.
+    """
+
+    def __init__(self, load_version, ttl=2.0):
+        self._load = load_version
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires_at = 0.0
+
+    def __call__(self):
+        now = time.monotonic()
+        with self._lock:
+            if self._value is not None and now < self._expires_at:
+                return self._value
+        value = self._load()
+        with self._lock:
+            self._value = value
+            self._expires_at = now + self.ttl
+        return value
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+
+
+def not_modified(etag, last_modified):
+    """True when the request's validators show the client already has this version."""
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified and request.if_modified_since:
+        return last_modified.replace(microsecond=0) <= request.if_modified_since
+    return False
+
+
+def conditional_get(load_version, prefix):
+    """
+    Decorator factory for conditional GET.
+
+    load_version() returns (version, last_modified) for the data behind the
+    view, where last_modified is a timezone-aware datetime or None. The ETag
+    combines the version with the request path and query string, so a 304 is
+    answered before the view (and its queries) runs. The version is stored on
+    g.<prefix>_version for views that want it in their cache keys. If
+    load_version() raises, the client gets the views' usual JSON 500.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version, last_modified = load_version()
+            except Exception as e:
+                current_app.logger.warning('Could not load %s version: %s', prefix, e)
+                return jsonify({'error': str(e)}), 500
+            setattr(g, f'{prefix}_version', version)
+            digest = hashlib.sha1(
+                repr((request.path, sorted(request.args.items(multi=True)))).encode()
+            ).hexdigest()[:16]
+            etag = f'{prefix}-{version}-{digest}'
+
+            if not_modified(etag, last_modified):
+                resp = Response(status=304)
+            else:
+                resp = make_response(view(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+            resp.set_etag(etag)
+            if last_modified:
+                resp.last_modified = last_modified
+            # Let browsers keep the body but revalidate on every use
+            resp.headers['Cache-Control'] = 'no-cache'
+            return resp
+        return wrapper
+    return decorator
@@ -0,0 +1,133 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import tempfile
+
+# Longest edge in pixels for each variant the storefront asks for
+VARIANTS = {
+    'thumb': 160,
+    'card': 480,
+    'detail': 1200
+}
+FORMATS = {
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4},
+    'jpeg': {'format': 'JPEG', 'quality': 82, 'optimize': True, 'progressive': True}
+}
+PLACEHOLDER_SIZE = 16
+CHUNK_SIZE = 64 * 1024
+MANIFEST = 'manifest.json'
+
+
+class UploadTooLarge(Exception):
+    """The upload exceeded max_bytes while being streamed to disk."""
+
+
+def save_upload(stream, upload_dir, ext, max_bytes):
+    """
+    Streams an upload to disk in chunks while hashing it, and stores it as
+    <sha256>.<ext>. Identical uploads map to the same file, so a duplicate is
+    dropped instead of written twice. Returns (digest, filename, is_new).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=upload_dir, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(f'Image is larger than {max_bytes // (1024 * 1024)} MB')
+                digest.update(chunk)
+                out.write(chunk)
+
+        key = digest.hexdigest()
+        filename = f'{key}.{ext}'
+        final_path = os.path.join(upload_dir, filename)
+        if os.path.exists(final_path):
+            os.remove(tmp_path)
+            return key, filename, False
+        os.replace(tmp_path, final_path)
+        return key, filename, True
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def variant_dir(upload_dir, key):
+    return os.path.join(upload_dir, 'variants', key)
+
+
+def _write_atomic(path, data):
+    tmp_path = path + '.part'
+    with open(tmp_path, 'wb') as out:
+        out.write(data)
+    os.replace(tmp_path, path)
+
+
+def process_image(src_path, out_dir):
+    """
+    Process-pool job: writes every variant in every format plus a blurred
+    placeholder, then the manifest describing them. The manifest is written
+    last, so its presence means the set is complete; an existing manifest
+    makes this a no-op.
+    """
+    from PIL import Image, ImageFilter, ImageOps
+
+    manifest_path = os.path.join(out_dir, MANIFEST)
+    if os.path.exists(manifest_path):
+        return manifest_path
+    os.makedirs(out_dir, exist_ok=True)
+
+    try:
+        with Image.open(src_path) as original:
+            image = ImageOps.exif_transpose(original)
+            image.load()
+    except Exception as e:
+        _write_atomic(manifest_path, json.dumps({'error': f'Unreadable image: {e}'}).encode())
+        return manifest_path
+
+    has_alpha = image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info)
+    image = image.convert('RGBA' if has_alpha else 'RGB')
+    if has_alpha:
+        # JPEG has no alpha channel; flatten onto white
+        flat = Image.new('RGB', image.size, (255, 255, 255))
+        flat.paste(image, mask=image.getchannel('A'))
+    else:
+        flat = image
+
+    manifest = {'width': image.width, 'height': image.height, 'variants': {}}
+    for name, edge in VARIANTS.items():
+        for fmt, options in FORMATS.items():
+            # WebP keeps transparency; JPEG gets the flattened copy
+            resized = (image if fmt == 'webp' else flat).copy()
+            # Never upscale: small originals keep their size
+            resized.thumbnail((edge, edge), Image.LANCZOS)
+            buffer = io.BytesIO()
+            resized.save(buffer, **options)
+            _write_atomic(os.path.join(out_dir, f'{name}.{fmt}'), buffer.getvalue())
+        manifest['variants'][name] = {'width': resized.width, 'height': resized.height, 'formats': list(FORMATS)}
+
+    tiny = flat.copy()
+    tiny.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    tiny = tiny.filter(ImageFilter.GaussianBlur(1))
+    buffer = io.BytesIO()
+    tiny.save(buffer, format='JPEG', quality=40)
+    manifest['placeholder'] = 'data:image/jpeg;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+    _write_atomic(manifest_path, json.dumps(manifest).encode())
+    return manifest_path
+
+
+def load_manifest(upload_dir, key):
+    """The finished manifest for an upload, or None while it is still processing."""
+    try:
+        with open(os.path.join(variant_dir(upload_dir, key), MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
@@ -0,0 +1,69 @@
+from pymongo.errors import OperationFailure
+
+
+def ensure_indexes(db, specs):
+    """
+    Create every declared index. specs maps a collection name to a list of
+    IndexModel; indexes that already exist with the same keys and options
+    are left alone, so this is safe to run on every start.
+
+    Returns (created, errors): index names per collection, and the error
+    message per collection whose indexes could not be built (for example a
+    conflicting index that already uses the same name).
+    """
+    created = {}
+    errors = {}
+    for collection, models in specs.items():
+        try:
+            created[collection] = db[collection].create_indexes(models)
+        except OperationFailure as e:
+            errors[collection] = str(e)
+    return created, errors
+
+
+def _plan_stages(plan):
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for value in plan.values():
+            yield from _plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from _plan_stages(item)
+
+
+def explain_queries(db, probes):
+    """
+    Explain each probe and report the stages of its winning plan.
+
+    probes is a list of dicts with label, collection, filter and optional sort,
+    one per query shape the routes issue. Returns a list of
+    {'label', 'collection', 'stages', 'collscan'} in probe order.
+    """
+    report = []
+    for probe in probes:
+        command = {'find': probe['collection'], 'filter': probe['filter']}
+        if probe.get('sort'):
+            command['sort'] = probe['sort']
+        explained = db.command('explain', command, verbosity='queryPlanner')
+        stages = list(_plan_stages(explained['queryPlanner']['winningPlan']))
+        report.append({
+            'label': probe['label'],
+            'collection': probe['collection'],
+            'stages': stages,
+            'collscan': 'COLLSCAN' in stages
+        })
+    return report
+
+
+def print_report(created, errors, report=None):
+    for collection, names in created.items():
+        print(f"{collection}: {', '.join(names)}")
+    for collection, message in errors.items():
+        print(f"{collection}: FAILED - {message}")
+    if report is None:
+        return
+    for entry in report:
+        status = 'COLLSCAN' if entry['collscan'] else 'ok'
+        print(f"[{status}] {entry['label']} ({entry['collection']}): {' > '.join(entry['stages'])}")
+
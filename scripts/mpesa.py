@@ -0,0 +1,169 @@
+import base64
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class MpesaError(Exception):
+    """Daraja answered with an error or could not be reached."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+class MpesaClient:
+    """
+    Daraja (M-Pesa) API client for STK push and STK push query.
+
+    One requests.Session is shared by every request thread, so TLS connections
+    to Safaricom stay open between payments. The OAuth access token is cached
+    until token_margin seconds before it expires; when it needs refreshing,
+    one thread fetches it and the others wait for that result instead of
+    each asking for their own.
+
+    timeout is (connect, read) seconds and applies to every call.
+    """
+
+    def __init__(self, base_url, consumer_key, consumer_secret, short_code, passkey,
+                 callback_url, timeout=(3.05, 15), token_margin=60, pool_size=10):
+        self.base_url = base_url.rstrip('/')
+        self.short_code = short_code
+        self.callback_url = callback_url
+        self.timeout = timeout
+        self.token_margin = token_margin
+        self._auth = (consumer_key, consumer_secret)
+        self._passkey = passkey
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._token = None
+        self._token_expires_at = 0.0
+        self._token_lock = threading.Lock()
+
+        # Counters exposed through stats()
+        self._token_fetches = 0
+        self._stk_pushes = 0
+        self._stk_queries = 0
+
+    # ------------- OAuth token -------------
+
+    def _token_valid(self):
+        return self._token is not None and time.monotonic() < self._token_expires_at
+
+    def access_token(self):
+        if self._token_valid():
+            return self._token
+        with self._token_lock:
+            # Whoever held the lock before us may already have refreshed it
+            if self._token_valid():
+                return self._token
+            try:
+                response = self.session.get(
+                    f'{self.base_url}/oauth/v1/generate',
+                    params={'grant_type': 'client_credentials'},
+                    auth=self._auth,
+                    timeout=self.timeout
+                )
+            except requests.RequestException as e:
+                raise MpesaError(f'M-Pesa auth request failed: {e}')
+            if response.status_code != 200:
+                raise MpesaError(f'M-Pesa auth failed with HTTP {response.status_code}', response.status_code)
+            data = self._json(response, 'auth')
+            try:
+                expires_in = int(data.get('expires_in', 3599))
+                self._token = data['access_token']
+            except (KeyError, TypeError, ValueError):
+                raise MpesaError('M-Pesa auth reply has no usable access_token')
+            self._token_expires_at = time.monotonic() + max(expires_in - self.token_margin, 0)
+            self._token_fetches += 1
+            return self._token
+
+    def invalidate_token(self):
+        with self._token_lock:
+            self._token = None
+            self._token_expires_at = 0.0
+
+    # ------------- STK push -------------
+
+    @staticmethod
+    def _json(response, what):
+        # A 200 with an HTML error page or a truncated body is Daraja's failure, not ours
+        try:
+            data = response.json()
+        except ValueError:
+            raise MpesaError(f'M-Pesa {what} reply is not JSON: {response.text[:200]}')
+        if not isinstance(data, dict):
+            raise MpesaError(f'M-Pesa {what} reply is not a JSON object')
+        return data
+
+    def password(self, timestamp):
+        return base64.b64encode(f'{self.short_code}{self._passkey}{timestamp}'.encode()).decode()
+
+    def _post(self, path, payload):
+        token = self.access_token()
+        try:
+            return self.session.post(
+                f'{self.base_url}{path}',
+                json=payload,
+                headers={'Authorization': f'Bearer {token}'},
+                timeout=self.timeout
+            )
+        except requests.RequestException as e:
+            raise MpesaError(f'M-Pesa request failed: {e}')
+
+    def stk_push(self, amount, phone, account_reference, description, callback_url=None):
+        """Sends the payment prompt to the customer's phone and returns Daraja's JSON reply."""
+        timestamp = time.strftime('%Y%m%d%H%M%S')
+        payload = {
+            'BusinessShortCode': self.short_code,
+            'Password': self.password(timestamp),
+            'Timestamp': timestamp,
+            'TransactionType': 'CustomerPayBillOnline',
+            'Amount': amount,
+            'PartyA': phone,
+            'PartyB': self.short_code,
+            'PhoneNumber': phone,
+            'CallBackURL': callback_url or self.callback_url,
+            'AccountReference': account_reference,
+            'TransactionDesc': description
+        }
+        self._stk_pushes += 1
+        return self._call('/mpesa/stkpush/v1/processrequest', payload, 'STK push')
+
+    def stk_query(self, checkout_request_id):
+        """Daraja's own record of a push's outcome: ResultCode '0' means paid."""
+        timestamp = time.strftime('%Y%m%d%H%M%S')
+        payload = {
+            'BusinessShortCode': self.short_code,
+            'Password': self.password(timestamp),
+            'Timestamp': timestamp,
+            'CheckoutRequestID': checkout_request_id
+        }
+        self._stk_queries += 1
+        return self._call('/mpesa/stkpushquery/v1/query', payload, 'STK query')
+
+    def _call(self, path, payload, what):
+        response = self._post(path, payload)
+        if response.status_code == 401:
+            # Token revoked or expired early; fetch a new one and try once more
+            self.invalidate_token()
+            response = self._post(path, payload)
+        if response.status_code != 200:
+            raise MpesaError(f'{what} failed with HTTP {response.status_code}: {response.text[:200]}',
+                             response.status_code)
+        return self._json(response, what)
+
+    def stats(self):
+        return {
+            'tokenFetches': self._token_fetches,
+            'stkPushes': self._stk_pushes,
+            'stkQueries': self._stk_queries,
+            'tokenCached': self._token_valid(),
+            'tokenExpiresInS': round(max(self._token_expires_at - time.monotonic(), 0), 1)
+        }
@@ -0,0 +1,196 @@
+"""
+Local stand-in for the Daraja endpoints MpesaClient uses, for tests and
+benchmarks without touching Safaricom's sandbox.
+
+    python mpesa_stub.py --port 8089 --latency-ms 80 --callback-delay 2
+    MPESA_BASE_URL=http://127.0.0.1:8089 python app.py
+
+Each accepted STK push is answered on its CallBackURL after --callback-delay
+seconds with --result-code (0 = paid, 1032 = cancelled by the customer),
+and STK push queries for it report the same result.
+From Python, start_stub() runs it on a background thread and returns the
+server and its base URL. GET /stub/stats reports the request counts.
+"""
+import argparse
+import base64
+import json
+import threading
+import time
+import urllib.request
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+
+class StubState:
+    def __init__(self, latency=0.0, token_ttl=3599, callback_delay=None, result_code=0):
+        self.latency = latency
+        self.token_ttl = token_ttl
+        self.callback_delay = callback_delay
+        self.result_code = result_code
+        self.lock = threading.Lock()
+        self.tokens = {}  # token -> expires_at
+        self.checkouts = {}  # checkout id -> result code
+        self.counts = {'oauth': 0, 'stkpush': 0, 'stkquery': 0, 'unauthorized': 0,
+                       'callbacks': 0, 'callbackErrors': 0}
+
+    def count(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def issue_token(self):
+        token = uuid.uuid4().hex
+        with self.lock:
+            self.tokens[token] = time.monotonic() + self.token_ttl
+        return token
+
+    def token_ok(self, token):
+        with self.lock:
+            expires_at = self.tokens.get(token)
+        return expires_at is not None and expires_at > time.monotonic()
+
+
+def send_callback(state, url, merchant_id, checkout_id, payload):
+    """Posts a Daraja-shaped stkCallback for one push."""
+    callback = {
+        'MerchantRequestID': merchant_id,
+        'CheckoutRequestID': checkout_id,
+        'ResultCode': state.result_code,
+        'ResultDesc': 'The service request is processed successfully.' if state.result_code == 0
+                      else 'Request cancelled by user'
+    }
+    if state.result_code == 0:
+        callback['CallbackMetadata'] = {'Item': [
+            {'Name': 'Amount', 'Value': payload.get('Amount')},
+            {'Name': 'MpesaReceiptNumber', 'Value': uuid.uuid4().hex[:10].upper()},
+            {'Name': 'TransactionDate', 'Value': int(time.strftime('%Y%m%d%H%M%S'))},
+            {'Name': 'PhoneNumber', 'Value': payload.get('PhoneNumber')}
+        ]}
+    body = json.dumps({'Body': {'stkCallback': callback}}).encode()
+    req = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    try:
+        urllib.request.urlopen(req, timeout=10).read()
+        state.count('callbacks')
+    except Exception:
+        state.count('callbackErrors')
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        raw = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def do_GET(self):
+        state = self.server.state
+        path = urlparse(self.path).path
+        if path == '/stub/stats':
+            with state.lock:
+                return self._reply(200, dict(state.counts))
+        if path != '/oauth/v1/generate':
+            return self._reply(404, {'errorMessage': 'Not found'})
+
+        time.sleep(state.latency)
+        state.count('oauth')
+        auth = self.headers.get('Authorization', '')
+        if not auth.startswith('Basic ') or ':' not in base64.b64decode(auth[6:]).decode(errors='replace'):
+            state.count('unauthorized')
+            return self._reply(400, {'errorMessage': 'Invalid Authentication passed'})
+        self._reply(200, {'access_token': state.issue_token(), 'expires_in': str(state.token_ttl)})
+
+    def do_POST(self):
+        state = self.server.state
+        path = urlparse(self.path).path
+        if path not in ('/mpesa/stkpush/v1/processrequest', '/mpesa/stkpushquery/v1/query'):
+            return self._reply(404, {'errorMessage': 'Not found'})
+
+        time.sleep(state.latency)
+        payload = self._read_json()
+        auth = self.headers.get('Authorization', '')
+        if not auth.startswith('Bearer ') or not state.token_ok(auth[7:]):
+            state.count('unauthorized')
+            return self._reply(401, {'errorCode': '404.001.03', 'errorMessage': 'Invalid Access Token'})
+        if path == '/mpesa/stkpushquery/v1/query':
+            return self._query(state, payload)
+        state.count('stkpush')
+        missing = [f for f in ('BusinessShortCode', 'Password', 'Timestamp', 'Amount', 'PhoneNumber', 'CallBackURL')
+                   if not payload.get(f)]
+        if missing:
+            return self._reply(400, {'errorCode': '400.002.02', 'errorMessage': f'Bad Request - Invalid {missing[0]}'})
+        merchant_id = uuid.uuid4().hex[:20]
+        checkout_id = 'ws_CO_' + uuid.uuid4().hex[:20]
+        with state.lock:
+            state.checkouts[checkout_id] = state.result_code
+        self._reply(200, {
+            'MerchantRequestID': merchant_id,
+            'CheckoutRequestID': checkout_id,
+            'ResponseCode': '0',
+            'ResponseDescription': 'Success. Request accepted for processing',
+            'CustomerMessage': 'Success. Request accepted for processing'
+        })
+        if state.callback_delay is not None:
+            timer = threading.Timer(state.callback_delay, send_callback,
+                                    args=(state, payload['CallBackURL'], merchant_id, checkout_id, payload))
+            timer.daemon = True
+            timer.start()
+
+    def _query(self, state, payload):
+        state.count('stkquery')
+        with state.lock:
+            result_code = state.checkouts.get(payload.get('CheckoutRequestID'))
+        if result_code is None:
+            return self._reply(400, {'errorCode': '400.002.02', 'errorMessage': 'Bad Request - Invalid CheckoutRequestID'})
+        self._reply(200, {
+            'ResponseCode': '0',
+            'ResponseDescription': 'The service request has been accepted successfully',
+            'CheckoutRequestID': payload['CheckoutRequestID'],
+            'ResultCode': str(result_code),
+            'ResultDesc': 'The service request is processed successfully.' if result_code == 0
+                          else 'Request cancelled by user'
+        })
+
+
+def start_stub(host='127.0.0.1', port=0, latency=0.0, token_ttl=3599, callback_delay=None, result_code=0):
+    """Starts the stub on a daemon thread; port=0 picks a free port, callback_delay=None sends no callbacks."""
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(latency, token_ttl, callback_delay, result_code)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://{host}:{server.server_address[1]}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8089)
+    parser.add_argument('--latency-ms', type=float, default=0.0)
+    parser.add_argument('--token-ttl', type=int, default=3599)
+    parser.add_argument('--callback-delay', type=float, default=2.0,
+                        help='seconds before the result callback; negative disables callbacks')
+    parser.add_argument('--result-code', type=int, default=0)
+    args = parser.parse_args()
+
+    callback_delay = args.callback_delay if args.callback_delay >= 0 else None
+    server, url = start_stub(args.host, args.port, args.latency_ms / 1000, args.token_ttl,
+                             callback_delay, args.result_code)
+    print(f'M-Pesa stub listening on {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
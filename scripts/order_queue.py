@@ -0,0 +1,126 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+
+class QueueFull(Exception):
+    """Raised by submit() when max_pending jobs are already waiting."""
+
+
+class GroupCommitQueue:
+    """
+    In-process queue that hands submitted jobs to a writer thread in batches,
+    so one transaction and one commit serve many requests.
+
+    handle_batch:  callable(list of (reference, payload)) -> {reference: result};
+                   runs on the writer thread and owns the transaction
+    max_batch:     most jobs handed over at once
+    max_wait:      seconds the oldest job in a batch may wait for company
+    max_pending:   queued jobs before submit() raises QueueFull
+    keep_results:  finished results remembered for status()
+    """
+
+    def __init__(self, handle_batch, max_batch=50, max_wait=0.02,
+                 max_pending=1000, keep_results=10000):
+        self._handle_batch = handle_batch
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.keep_results = keep_results
+
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._lock = threading.Lock()
+        self._results = OrderedDict()  # reference -> result dict
+        self._thread = None
+        self._pid = None
+
+        # Counters exposed through stats()
+        self._submitted = 0
+        self._rejected_full = 0
+        self._batches = 0
+        self._jobs_done = 0
+        self._batch_failures = 0
+        self._max_batch_seen = 0
+
+    def _ensure_writer(self):
+        # A forked worker inherits the Thread object but not the running thread
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+            self._thread.start()
+
+    def submit(self, payload):
+        """Queue a job and return its reference straight away."""
+        self._ensure_writer()
+        reference = uuid.uuid4().hex
+        with self._lock:
+            self._results[reference] = {'status': 'queued'}
+        try:
+            self._queue.put_nowait((reference, payload))
+        except queue.Full:
+            with self._lock:
+                self._results.pop(reference, None)
+                self._rejected_full += 1
+            raise QueueFull('Order queue is full')
+        with self._lock:
+            self._submitted += 1
+        return reference
+
+    def status(self, reference):
+        """The job's result dict, or None if this process doesn't know it."""
+        with self._lock:
+            result = self._results.get(reference)
+            return dict(result) if result is not None else None
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                results = self._handle_batch(batch)
+                failed = False
+            except Exception as e:
+                results = {ref: {'status': 'failed', 'error': str(e)} for ref, _ in batch}
+                failed = True
+
+            with self._lock:
+                self._batches += 1
+                self._jobs_done += len(batch)
+                self._batch_failures += failed
+                self._max_batch_seen = max(self._max_batch_seen, len(batch))
+                for ref, _ in batch:
+                    self._results[ref] = results.get(ref, {'status': 'failed', 'error': 'No result'})
+                    self._results.move_to_end(ref)
+                while len(self._results) > self.keep_results:
+                    self._results.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'pending': self._queue.qsize(),
+                'submitted': self._submitted,
+                'rejectedFull': self._rejected_full,
+                'batches': self._batches,
+                'jobsDone': self._jobs_done,
+                'batchFailures': self._batch_failures,
+                'avgBatchSize': round(self._jobs_done / self._batches, 2) if self._batches else 0.0,
+                'maxBatchSize': self._max_batch_seen,
+                'maxBatch': self.max_batch,
+                'maxWaitMs': round(self.max_wait * 1000, 2)
+            }
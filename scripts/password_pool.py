@@ -0,0 +1,114 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+
+
+class HasherBusy(Exception):
+    """Raised when the pool is at capacity or a job misses its deadline."""
+
+
+class PasswordHasher:
+    """
+    Runs password hashing / verification in a process pool so the KDF work
+    neither blocks request threads nor holds the GIL.
+
+    hash_func:       picklable callable(password) -> hash
+    verify_func:     picklable callable(hash, password) -> bool
+    workers:         pool processes; 0 runs inline on the calling thread
+    max_pending:     jobs admitted at once (running + waiting); the rest get HasherBusy
+    admit_timeout:   seconds a caller may wait for admission
+    timeout:         seconds to wait for an admitted job's result
+    """
+
+    def __init__(self, hash_func, verify_func, workers=2, max_pending=32,
+                 admit_timeout=0.5, timeout=10.0):
+        self._hash_func = hash_func
+        self._verify_func = verify_func
+        self.workers = workers
+        self.max_pending = max_pending
+        self.admit_timeout = admit_timeout
+        self.timeout = timeout
+
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+
+        # Counters exposed through stats()
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._in_flight = 0
+        self._run_time_total = 0.0
+
+    def _pool(self):
+        # Forked web workers must not share their parent's pool; spawn keeps the
+        # children free of the server's threads and open sockets
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(timeout=self.admit_timeout):
+            with self._lock:
+                self._rejected += 1
+            raise HasherBusy('Too many sign-ins in progress, please retry')
+
+        started = time.monotonic()
+        release_slot = True
+        with self._lock:
+            self._in_flight += 1
+        try:
+            if self.workers == 0:
+                return func(*args)
+            future = self._pool().submit(func, *args)
+            try:
+                return future.result(timeout=self.timeout)
+            except FutureTimeout:
+                # A job that already started can't be cancelled; it keeps its
+                # slot until it finishes so max_pending still bounds the pool
+                if not future.cancel():
+                    release_slot = False
+                    future.add_done_callback(lambda _: self._slots.release())
+                with self._lock:
+                    self._timeouts += 1
+                raise HasherBusy('Password check timed out, please retry')
+        finally:
+            with self._lock:
+                self._in_flight -= 1
+                self._completed += 1
+                self._run_time_total += time.monotonic() - started
+            if release_slot:
+                self._slots.release()
+
+    def hash(self, password):
+        return self._run(self._hash_func, password)
+
+    def verify(self, pwhash, password):
+        return self._run(self._verify_func, pwhash, password)
+
+    def warm_up(self):
+        """Start the worker processes ahead of the first login."""
+        if self.workers:
+            pool = self._pool()
+            for future in [pool.submit(os.getpid) for _ in range(self.workers)]:
+                future.result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'maxPending': self.max_pending,
+                'inFlight': self._in_flight,
+                'completed': self._completed,
+                'rejected': self._rejected,
+                'timeouts': self._timeouts,
+                'avgTimeMs': round(self._run_time_total * 1000 / self._completed, 2) if self._completed else 0.0
+            }
@@ -0,0 +1,30 @@
+# stockStatus is kept in step with stock / lowStockThreshold on every product
+# write so inventory filters can be answered from an index instead of in Python.
+
+STOCK_STATUS_EXPR = {
+    '$switch': {
+        'branches': [
+            {'case': {'$lte': [{'$ifNull': ['$stock', 0]}, 0]}, 'then': 'out-of-stock'},
+            {'case': {'$lte': ['$stock', {'$ifNull': ['$lowStockThreshold', 10]}]}, 'then': 'low-stock'}
+        ],
+        'default': 'in-stock'
+    }
+}
+
+
+def stock_status(stock, low_stock_threshold=10):
+    """Python twin of STOCK_STATUS_EXPR for documents about to be written."""
+    if stock <= 0:
+        return 'out-of-stock'
+    if stock <= low_stock_threshold:
+        return 'low-stock'
+    return 'in-stock'
+
+
+def backfill_stock_status(products):
+    """Set stockStatus on products written before it was maintained; returns the count."""
+    result = products.update_many(
+        {'stockStatus': {'$exists': False}},
+        [{'$set': {'stockStatus': STOCK_STATUS_EXPR}}]
+    )
+    return result.modified_count